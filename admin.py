@@ -1,15 +1,22 @@
 import os
 import time
-import sqlite3
 from datetime import datetime, timedelta
 import telebot
 from dotenv import load_dotenv
 from telebot import types
-from lib.utils import is_admin, reset_user_state, confirm_booking, reject_booking, format_booking_info, format_date, format_date_to_db, validate_input
-from lib.schedule_tasks import get_grouped_bookings_for_cancellation, clear_booking_slots, get_grouped_unconfirmed_bookings
-from lib.schedule_generator import create_schedule_grid_image, create_daily_schedule_image
-from lib.keyboards import send_booking_selection_keyboard, send_date_selection_keyboard
-from lib.notifiers import notify_subscribers_for_cancellation, notify_booking_cancelled
+from lib.repository import get_repository
+from lib.db_init import init_db
+from lib.outbox import start_outbox_dispatcher
+from lib.telegram_files import send_schedule_photo
+from lib.utils import is_admin, reset_user_state, format_hours, confirm_booking, reject_booking, apply_booking_groups, format_booking_info, format_date, format_date_to_db, validate_input, split_message_pages
+from lib.schedule_tasks import get_cancellable_booking_groups, clear_booking_slots, get_grouped_unconfirmed_bookings
+from lib.keyboards import send_booking_selection_keyboard, send_date_selection_keyboard, ADMIN_MENU_KEYBOARD, SCHEDULE_TYPE_KEYBOARD, SCHEDULE_FORMAT_KEYBOARD, NOTIFY_CHOICE_KEYBOARD, create_page_keyboard, create_bulk_action_keyboard, SEARCH_KEYBOARD
+from lib.notifiers import subscriber_notifications, format_booking_cancelled_message
+from lib.booking_tokens import create_booking_token, resolve_booking_callback, claim_booking_token, release_booking_token
+from lib.timeslots import SLOT_MINUTES, SLOT_DELTA, shift_date, slot_index, slot_index_datetime, slot_date, slot_time, format_full_date
+from lib.rooms import ROOM_IDS, has_multiple_rooms, get_room_name, get_room_caption
+from lib.stats import load_usage_stats
+from lib.search import search_booking_groups
 
 load_dotenv()
 user_states = {}
@@ -18,13 +25,12 @@ MAIN_BOT_TOKEN = os.getenv("MAIN_BOT_TOKEN")
 ADMIN_IDS = list(map(int, os.getenv("ADMIN_IDS", "").split(",")))
 admin_bot = telebot.TeleBot(ADMIN_BOT_TOKEN)
 main_bot = telebot.TeleBot(MAIN_BOT_TOKEN)
+schedule_list_pages = {}
+pending_batches = {}
+STALE_BOOKING_MESSAGE = "⚠️ Бронь устарела: её уже обработали или изменили."
 
 def show_menu(message):
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(types.KeyboardButton("Просмотреть неподтвержденные брони"))
-    markup.add(types.KeyboardButton("Посмотреть расписание"))
-    markup.add(types.KeyboardButton("Отменить бронь"))
-    admin_bot.send_message(message.chat.id, "Выберите действие:", reply_markup=markup)
+    admin_bot.send_message(message.chat.id, "Выберите действие:", reply_markup=ADMIN_MENU_KEYBOARD)
     reset_user_state(message.chat.id, user_states)
 
 @admin_bot.message_handler(commands=['start'])
@@ -37,37 +43,43 @@ def handle_start(message):
 
 @admin_bot.message_handler(func=lambda msg: msg.text == "Посмотреть расписание")
 def view_schedule(message):
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.row(types.KeyboardButton("Расписание на 28 дней"), types.KeyboardButton("Расписание на сегодня"))
-    admin_bot.send_message(message.chat.id, "Выберите тип расписания:", reply_markup=markup)
+    admin_bot.send_message(message.chat.id, "Выберите тип расписания:", reply_markup=SCHEDULE_TYPE_KEYBOARD)
     reset_user_state(message.chat.id, user_states)
 
 @admin_bot.message_handler(func=lambda msg: msg.text == "Расписание на 28 дней")
 def view_28_days_schedule(message):
-    path = create_schedule_grid_image(message.chat.id, days_to_show=28)
-    if path:
-        with open(path, "rb") as img:
-            admin_bot.send_photo(message.chat.id, img, caption="Расписание на ближайшие 28 дней:")
-        os.remove(path)
-    else:
+    from lib.schedule_generator import create_schedule_grid_image, get_schedule_grid_variant
+    sent = False
+    for room in ROOM_IDS:
+        if send_schedule_photo(
+            admin_bot, "admin", message.chat.id,
+            get_schedule_grid_variant(message.chat.id, days_to_show=28, room=room),
+            lambda: create_schedule_grid_image(message.chat.id, days_to_show=28, room=room),
+            caption=f"Расписание на ближайшие 28 дней{get_room_caption(room)}:"
+        ):
+            sent = True
+    if not sent:
         admin_bot.send_message(message.chat.id, "Нет данных для отображения расписания.")
     reset_user_state(message.chat.id, user_states)
     show_menu(message)
 
 @admin_bot.message_handler(func=lambda msg: msg.text == "Расписание на сегодня")
 def view_today_schedule(message):
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.row(types.KeyboardButton("Картинкой"), types.KeyboardButton("Списком"))
-    admin_bot.send_message(message.chat.id, "Выберите формат расписания:", reply_markup=markup)
+    admin_bot.send_message(message.chat.id, "Выберите формат расписания:", reply_markup=SCHEDULE_FORMAT_KEYBOARD)
 
 @admin_bot.message_handler(func=lambda msg: msg.text == "Картинкой")
 def send_schedule_image(message):
-    path = create_daily_schedule_image(message.chat.id)
-    if path:
-        with open(path, "rb") as img:
-            admin_bot.send_photo(message.chat.id, img, caption="Расписание на сегодня:")
-        os.remove(path)
-    else:
+    from lib.schedule_generator import create_daily_schedule_image, get_daily_schedule_variant
+    sent = False
+    for room in ROOM_IDS:
+        if send_schedule_photo(
+            admin_bot, "admin", message.chat.id,
+            get_daily_schedule_variant(room),
+            lambda: create_daily_schedule_image(message.chat.id, room=room),
+            caption=f"Расписание на сегодня{get_room_caption(room)}:"
+        ):
+            sent = True
+    if not sent:
         admin_bot.send_message(message.chat.id, "Нет данных для отображения расписания на сегодня.")
     reset_user_state(message.chat.id, user_states)
     show_menu(message)
@@ -76,59 +88,75 @@ def send_schedule_image(message):
 def send_schedule_list(message):
     chat_id = message.chat.id
     today = datetime.now().strftime("%Y-%m-%d")
-    tomorrow = (datetime.strptime(today, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT date, time, group_name, contact_info, booking_type, comment FROM slots WHERE date IN (?, ?) AND status != 0 ORDER BY date, time', (today, tomorrow))
-    rows = cursor.fetchall()
-    conn.close()
+    tomorrow = shift_date(today, 1)
+    rows = get_repository().load_booking_rows(dates=(today, tomorrow), extra_fields=("contact_info", "booking_type", "comment"))
     if not rows:
         admin_bot.send_message(chat_id, "На сегодня нет записей в расписании.")
         show_menu(message)
         return
-    def is_consecutive(prev_date, prev_time, curr_date, curr_time):
-        if not prev_time:
-            return False
-        prev_dt = datetime.strptime(f"{prev_date} {prev_time}", "%Y-%m-%d %H:%M")
-        curr_dt = datetime.strptime(f"{curr_date} {curr_time}", "%Y-%m-%d %H:%M")
-        return (curr_dt - prev_dt) == timedelta(hours=1)
     output_groups = []
     current_group = None
-    start_time = None
-    start_date = None
-    prev_time = None
-    prev_date = None
+    start_index = None
+    prev_index = None
     for row in rows:
-        date_str, time_str, group_name, contact_info, booking_type, comment = row
-        group_data = (group_name or "", contact_info or "", booking_type or "", comment or "")
-        if group_name is None and contact_info is None and booking_type is None and comment is None:
+        _, room, date_str, time_str, group_name, _, contact_info, booking_type, comment = row
+        group_data = (room, group_name or "", contact_info or "", booking_type or "", comment or "")
+        index = slot_index(date_str, time_str)
+        if index is None or (group_name is None and contact_info is None and booking_type is None and comment is None):
             continue
         if current_group is None:
             current_group = group_data
-            start_time = time_str
-            start_date = date_str
-        elif group_data != current_group or not is_consecutive(prev_date, prev_time, date_str, time_str):
-            end_dt = datetime.strptime(f"{prev_date} {prev_time}", "%Y-%m-%d %H:%M") + timedelta(hours=1)
-            output_groups.append((start_date, start_time, end_dt, current_group))
+            start_index = index
+        elif group_data != current_group or index != prev_index + 1:
+            output_groups.append((start_index, prev_index + 1, current_group))
             current_group = group_data
-            start_time = time_str
-            start_date = date_str
-        prev_time = time_str
-        prev_date = date_str
-    if current_group and prev_time and prev_date:
-        end_dt = datetime.strptime(f"{prev_date} {prev_time}", "%Y-%m-%d %H:%M") + timedelta(hours=1)
-        output_groups.append((start_date, start_time, end_dt, current_group))
+            start_index = index
+        prev_index = index
+    if current_group:
+        output_groups.append((start_index, prev_index + 1, current_group))
     now = datetime.now()
-    for start_date, start_time, end_dt, group_data in output_groups:
-        start_dt = datetime.strptime(f"{start_date} {start_time}", "%Y-%m-%d %H:%M")
-        if end_dt <= now or start_date != today:
+    notes = []
+    for start_index, end_index, group_data in sorted(output_groups, key=lambda g: (g[0], g[2][0])):
+        if slot_index_datetime(end_index) <= now or slot_date(start_index) != today:
             continue
-        send_schedule_list_notification(chat_id, start_dt.strftime("%H:%M"), end_dt.strftime("%H:%M"), group_data)
+        notes.append(format_schedule_list_entry(slot_time(start_index), slot_time(end_index), group_data))
     reset_user_state(chat_id, user_states)
+    if not notes:
+        admin_bot.send_message(chat_id, "На сегодня нет записей в расписании.")
+    else:
+        pages = split_message_pages(notes)
+        schedule_list_pages[chat_id] = pages
+        try:
+            admin_bot.send_message(chat_id, pages[0], parse_mode='Markdown', reply_markup=create_page_keyboard("list_page", 0, len(pages)))
+        except Exception as e:
+            print(f"[Error] Can't send schedule list to admin: {e}")
     show_menu(message)
 
-def send_schedule_list_notification(chat_id, start_time, end_time, group_data):
-    group_name, contact_info, booking_type, comment = group_data
+@admin_bot.callback_query_handler(func=lambda call: call.data.startswith("list_page:"))
+def handle_schedule_list_page(call):
+    value = call.data.split(":", 1)[1]
+    if not value.isdigit():
+        admin_bot.answer_callback_query(call.id)
+        return
+    pages = schedule_list_pages.get(call.message.chat.id)
+    page = int(value)
+    if not pages or page >= len(pages):
+        admin_bot.answer_callback_query(call.id, "Список устарел, запросите его заново.")
+        return
+    admin_bot.answer_callback_query(call.id)
+    try:
+        admin_bot.edit_message_text(
+            pages[page],
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            parse_mode='Markdown',
+            reply_markup=create_page_keyboard("list_page", page, len(pages))
+        )
+    except Exception as e:
+        print(f"[Error] Can't switch schedule list page: {e}")
+
+def format_schedule_list_entry(start_time, end_time, group_data):
+    room, group_name, contact_info, booking_type, comment = group_data
     if contact_info:
         contact_info = contact_info.strip()
         if contact_info.startswith("+7") or contact_info.startswith("8"):
@@ -141,24 +169,23 @@ def send_schedule_list_notification(chat_id, start_time, end_time, group_data):
             contact = contact_info
     else:
         contact = "не указан"
+    room_line = f"_Зал:_ *{get_room_name(room)}*\n" if has_multiple_rooms() else ""
     note = (
+        room_line +
         f"_Время:_ *{start_time}–{end_time}*\n"
         f"_Группа:_ *{group_name}*\n"
         f"_Тип:_ *{booking_type}*\n"
         f"_Комментарий:_ {comment}\n"
         f"_Контакт:_ {contact}"
     )
-    try:
-        admin_bot.send_message(chat_id, note, parse_mode='Markdown')
-    except Exception as e:
-        print(f"[Error] Can't send notification to admin: {e}")
+    return note
 
 def is_consecutive(prev_time, curr_time):
     if not prev_time:
         return False
     prev = datetime.strptime(prev_time, "%H:%M")
     curr = datetime.strptime(curr_time, "%H:%M")
-    return (curr - prev) == timedelta(hours=1)
+    return (curr - prev) == SLOT_DELTA
 
 @admin_bot.message_handler(func=lambda msg: msg.text == "Отменить бронь")
 def handle_cancel_booking(message):
@@ -166,22 +193,14 @@ def handle_cancel_booking(message):
     if not is_admin(admin_id):
         admin_bot.send_message(message.chat.id, "❌ У вас нет прав для выполнения этой операции.")
         return
-    today = datetime.now().date()
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT DISTINCT date FROM slots WHERE status IN (1, 2) AND date >= ? ORDER BY date', (today.strftime("%Y-%m-%d"),))
-    all_dates = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    valid_dates = []
-    for date_str in all_dates:
-        bookings = get_grouped_bookings_for_cancellation(date_str)
-        if bookings:
-            valid_dates.append(date_str)
+    today = datetime.now().strftime("%Y-%m-%d")
+    bookings_by_date = get_cancellable_booking_groups(today)
+    valid_dates = sorted(bookings_by_date)
     if not valid_dates:
         admin_bot.send_message(message.chat.id, "Нет доступных дней для отмены броней.")
         show_menu(message)
         return
-    user_states[admin_id] = {"step": "choose_date_for_cancellation", "valid_dates": valid_dates}
+    user_states[admin_id] = {"step": "choose_date_for_cancellation", "valid_dates": valid_dates, "bookings_by_date": bookings_by_date}
     send_date_selection_keyboard(message.chat.id, valid_dates, admin_bot)
 
 @admin_bot.message_handler(func=lambda msg: msg.text not in ["Назад", "На главную"] and user_states.get(msg.from_user.id, {}).get("step") == "choose_date_for_cancellation")
@@ -191,7 +210,7 @@ def handle_choose_date_for_cancellation(message):
     if selected_date not in user_states[admin_id]["valid_dates"]:
         admin_bot.send_message(message.chat.id, "Выберите корректный день из предложенных.")
         return
-    bookings = get_grouped_bookings_for_cancellation(selected_date)
+    bookings = user_states[admin_id]["bookings_by_date"][selected_date]
     today = datetime.now().date()
     selected_date_obj = datetime.strptime(selected_date, "%Y-%m-%d").date()
     current_hour = datetime.now().hour
@@ -245,32 +264,24 @@ def handle_choose_booking_for_cancellation(message):
         "step": "ask_notify_subscribers",
         "selected_group": selected_group
     })
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.row(types.KeyboardButton("✅ Да"), types.KeyboardButton("❌ Нет"))
-    admin_bot.send_message(message.chat.id, "Уведомить подписавшихся?", reply_markup=markup)
+    admin_bot.send_message(message.chat.id, "Уведомить подписавшихся?", reply_markup=NOTIFY_CHOICE_KEYBOARD)
 
 @admin_bot.message_handler(func=lambda msg: msg.text in ["✅ Да", "❌ Нет"] and user_states.get(msg.from_user.id, {}).get("step") == "ask_notify_subscribers")
 def handle_notify_choice(message):
     admin_id = message.from_user.id
     choice = message.text.strip()
     group = user_states[admin_id]["selected_group"]
-    if choice == "✅ Да":
-        notify_subscribers_for_cancellation(group, main_bot)
-    clear_booking_slots(group["ids"], main_bot)
     creator_id = group["user_id"]
     group_name = group["group_name"]
     start_time = group["start_time"].strftime("%H:%M")
     end_time = group["end_time"].strftime("%H:%M")
     date_str = group["start_time"].strftime("%Y-%m-%d")
-    formatted_date = datetime.strptime(date_str, "%Y-%m-%d").strftime("%d.%m.%Y")
-    notify_booking_cancelled(
-        user_id=creator_id,
-        bot=main_bot,
-        group_name=group_name,
-        start_time=start_time,
-        end_time=end_time,
-        date_formatted=formatted_date
-    )
+    formatted_date = format_full_date(date_str)
+    cancelled_message = format_booking_cancelled_message(group_name, start_time, end_time, formatted_date)
+    notifications = [("main", creator_id, cancelled_message, {"parse_mode": "Markdown"})]
+    notify_subscribers = subscriber_notifications if choice == "✅ Да" else None
+    if not clear_booking_slots(group["ids"], notifications, created_by=creator_id, notify_subscribers=notify_subscribers):
+        admin_bot.send_message(message.chat.id, STALE_BOOKING_MESSAGE)
     reset_user_state(admin_id, user_states)
     show_menu(message)
 
@@ -285,6 +296,71 @@ def handle_go_home(message):
     reset_user_state(message.chat.id, user_states)
     show_menu(message)
 
+def format_stats_minutes(minutes):
+    return format_hours(minutes // SLOT_MINUTES)
+
+def format_stats_line(title, requested, confirmed, rejected, cancelled):
+    return f"{title}: запрошено {format_stats_minutes(requested)}, подтверждено {format_stats_minutes(confirmed)}, отменено {format_stats_minutes(cancelled)}"
+
+def format_usage_stats(stats):
+    requested, confirmed, rejected, cancelled = stats['totals']
+    confirmation_rate = round(100 * confirmed / requested) if requested else 0
+    cancellation_rate = round(100 * cancelled / confirmed) if confirmed else 0
+    entries = [
+        f"📊 Статистика с {format_full_date(stats['since'])}\n"
+        f"Запрошено: {format_stats_minutes(requested)}\n"
+        f"Подтверждено: {format_stats_minutes(confirmed)} ({confirmation_rate}%)\n"
+        f"Не подтверждено: {format_stats_minutes(rejected)}\n"
+        f"Отменено после подтверждения: {format_stats_minutes(cancelled)} ({cancellation_rate}%)"
+    ]
+    sections = [
+        ("По неделям", [(f"{format_full_date(week)} – {format_full_date(shift_date(week, 6))}", *values) for week, *values in stats['by_week']]),
+        ("По типам", [(name or "Без типа", *values) for name, *values in stats['by_type']]),
+        ("Группы", [(name or "Без названия", *values) for name, *values in stats['by_group']]),
+    ]
+    for title, rows in sections:
+        if rows:
+            entries.append(f"{title}:\n" + "\n".join(format_stats_line(*row) for row in rows))
+    return entries
+
+@admin_bot.message_handler(func=lambda msg: msg.text == "Статистика")
+def handle_usage_stats(message):
+    if not is_admin(message.from_user.id):
+        admin_bot.send_message(message.chat.id, "❌ У вас нет прав для выполнения этой операции.")
+        return
+    stats = load_usage_stats(datetime.now().strftime("%Y-%m-%d"))
+    if not stats['totals'][0]:
+        admin_bot.send_message(message.chat.id, "Пока нет данных для статистики.")
+    else:
+        for page in split_message_pages(format_usage_stats(stats)):
+            admin_bot.send_message(message.chat.id, page)
+    show_menu(message)
+
+def format_search_result(group):
+    detail_lines = []
+    for field, title in (("booking_type", "Тип"), ("contact_info", "Контакт для связи"), ("comment", "Комментарий")):
+        if group.get(field):
+            detail_lines.append(f"{title}: {group[field]}")
+    return "\n".join([format_booking_info(group)] + detail_lines)
+
+@admin_bot.message_handler(func=lambda msg: msg.text == "Поиск броней")
+def handle_search_bookings(message):
+    if not is_admin(message.from_user.id):
+        admin_bot.send_message(message.chat.id, "❌ У вас нет прав для выполнения этой операции.")
+        return
+    user_states[message.from_user.id] = {"step": "search_bookings"}
+    admin_bot.send_message(message.chat.id, "Введите название группы, контакт или слово из комментария:", reply_markup=SEARCH_KEYBOARD)
+
+@admin_bot.message_handler(func=lambda msg: msg.text != "На главную" and user_states.get(msg.from_user.id, {}).get("step") == "search_bookings")
+def handle_search_query(message):
+    groups = search_booking_groups(message.text or "")
+    if not groups:
+        admin_bot.send_message(message.chat.id, "Ничего не найдено. Попробуйте другой запрос или вернитесь на главную.")
+        return
+    for page in split_message_pages([format_search_result(group) for group in groups]):
+        admin_bot.send_message(message.chat.id, page)
+    show_menu(message)
+
 @admin_bot.message_handler(func=lambda msg: msg.text == "Просмотреть неподтвержденные брони")
 def handle_view_unconfirmed(message):
     admin_id = message.from_user.id
@@ -297,87 +373,141 @@ def handle_view_unconfirmed(message):
         show_menu(message)
         return
     user_states[admin_id] = 'awaiting_confirmation_action'
+    bookings = []
     for group in groups:
         info = format_booking_info(group)
-        ids = group['ids']
-        user_id = group['user_id']
+        booking = {
+            'ids': group['ids'],
+            'created_by': group['user_id'],
+            'date': group['date_str'],
+            'start_time': group['start_time'].strftime("%H:%M"),
+            'end_time': group['end_time'].strftime("%H:%M"),
+            'group_name': group['group_name']
+        }
+        bookings.append(booking)
+        token = create_booking_token(group['ids'], booking)
         markup = types.InlineKeyboardMarkup()
-        confirm_btn = types.InlineKeyboardButton("✅ Подтвердить", callback_data=f"confirm:{','.join(map(str, ids))}:{user_id}")
-        reject_btn = types.InlineKeyboardButton("❌ Отклонить", callback_data=f"reject:{','.join(map(str, ids))}:{user_id}")
+        confirm_btn = types.InlineKeyboardButton("✅ Подтвердить", callback_data=f"confirm:{token}")
+        reject_btn = types.InlineKeyboardButton("❌ Отклонить", callback_data=f"reject:{token}")
         markup.add(confirm_btn, reject_btn)
         admin_bot.send_message(message.chat.id, info, reply_markup=markup)
+    if len(bookings) > 1:
+        sent = admin_bot.send_message(message.chat.id, "Массовые действия:", reply_markup=create_bulk_action_keyboard(bookings, set()))
+        pending_batches[message.chat.id] = {"message_id": sent.message_id, "bookings": bookings, "selected": set()}
     show_menu(message)
 
+def format_booking_date(booking):
+    try:
+        return format_full_date(booking['date'])
+    except (TypeError, ValueError):
+        return "неизвестная дата"
+
+def format_confirmation_message(booking):
+    return f"✅ Ваша бронь для группы «{booking['group_name']}» подтверждена!\nОжидаем вас {format_booking_date(booking)} в {booking['start_time']} по адресу проспект Труда, 111А.\nСвязь с админом: @cyberocalypse"
+
+def format_decline_message(booking):
+    return f"❌ К сожалению, по техническим причинам мы вынуждены отклонить вашу бронь для группы «{booking['group_name'] or 'неизвестная группа'}» {format_booking_date(booking)} в {booking['start_time']}.\nПриносим извинения за неудобства. 😔\nПожалуйста, выберите другое время.\nСвязь с админом: @cyberocalypse"
+
+@admin_bot.callback_query_handler(func=lambda call: call.data.startswith("bulk:"))
+def handle_bulk_action(call):
+    chat_id = call.message.chat.id
+    batch = pending_batches.get(chat_id)
+    if not batch or batch["message_id"] != call.message.message_id:
+        admin_bot.answer_callback_query(call.id, "Список устарел, запросите его заново.")
+        return
+    action = call.data.split(":", 2)[1]
+    bookings = batch["bookings"]
+    if action == "toggle":
+        index = int(call.data.split(":", 2)[2])
+        batch["selected"] ^= {index}
+        admin_bot.answer_callback_query(call.id)
+        try:
+            admin_bot.edit_message_reply_markup(chat_id=chat_id, message_id=call.message.message_id, reply_markup=create_bulk_action_keyboard(bookings, batch["selected"]))
+        except Exception as e:
+            print(f"[Error] Не удалось обновить выбор: {e}")
+        return
+    if action == "confirm_selected":
+        targets = [bookings[i] for i in sorted(batch["selected"])]
+        if not targets:
+            admin_bot.answer_callback_query(call.id, "Ничего не выбрано.")
+            return
+    else:
+        targets = bookings
+    confirm = action != "reject_all"
+    format_message = format_confirmation_message if confirm else format_decline_message
+    def user_notifications(applied):
+        messages_by_user = {}
+        for booking in applied:
+            messages_by_user.setdefault(booking['created_by'], []).append(format_message(booking))
+        return [("main", user_id, "\n\n".join(messages), {}) for user_id, messages in messages_by_user.items()]
+    applied = apply_booking_groups(targets, confirm=confirm, notify=user_notifications)
+    pending_batches.pop(chat_id, None)
+    verb = "Подтверждено" if confirm else "Отклонено"
+    admin_bot.answer_callback_query(call.id, f"{verb}: {len(applied)} из {len(targets)}.")
+    try:
+        admin_bot.edit_message_text(
+            f"{verb} броней: {len(applied)} из {len(targets)}.",
+            chat_id=chat_id,
+            message_id=call.message.message_id,
+            reply_markup=None
+        )
+    except Exception as e:
+        print(f"[Error] Не удалось обновить сообщение: {e}")
+
 @admin_bot.callback_query_handler(func=lambda call: ':' in call.data)
 def handle_callback_query(call):
     try:
-        action, booking_ids_str, user_id_str = call.data.split(":")
-        booking_ids = list(map(int, booking_ids_str.split(',')))
-        user_id = int(user_id_str)
+        action, booking = resolve_booking_callback(call.data)
     except ValueError:
         admin_bot.answer_callback_query(call.id, "❌ Ошибка при обработке запроса.")
         return
-    group_name = None
+    token = booking.get('token') if booking else None
+    if token and not claim_booking_token(token):
+        admin_bot.answer_callback_query(call.id, "Эта бронь уже обработана.")
+        remove_callback_keyboard(call)
+        return
     try:
-        with sqlite3.connect('db/bookings.db') as conn:
-            cursor = conn.cursor()
-            query_slots = 'SELECT date, time, group_name FROM slots WHERE id IN ({}) ORDER BY time'.format(','.join('?' * len(booking_ids)))
-            cursor.execute(query_slots, booking_ids)
-            rows = cursor.fetchall()
-            if not rows:
-                raise Exception("Не найдено данных о слотах")
-            cursor.execute('SELECT id, status FROM slots WHERE id IN ({})'.format(','.join('?' * len(booking_ids))), booking_ids)
-            status_rows = cursor.fetchall()
-            status_set = set(status for _, status in status_rows)
-        dates = set(row[0] for row in rows)
-        times = [row[1] for row in rows]
-        group_name = rows[0][2]
-        date_str = dates.pop() if dates else "неизвестная дата"
-        if len(dates) > 1:
-            date_str = f"{date_str} и другие даты"
-        start_time = times[0]
-        end_time = times[-1]
-        try:
-            formatted_date = datetime.strptime(date_str, "%Y-%m-%d").strftime("%d.%m.%Y")
-        except ValueError:
-            formatted_date = "неизвестная дата"
-        confirmation_message = f"✅ Ваша бронь для группы «{group_name}» подтверждена!\nОжидаем вас {formatted_date} в {start_time} по адресу проспект Труда, 111А.\nСвязь с админом: @cyberocalypse"
-        decline_message = f"❌ К сожалению, по техническим причинам мы вынуждены отклонить вашу бронь для группы «{group_name or 'неизвестная группа'}» {formatted_date} в {start_time}.\nПриносим извинения за неудобства. 😔\nПожалуйста, выберите другое время.\nСвязь с админом: @cyberocalypse"
+        if not booking:
+            raise Exception("Не найдено данных о слотах")
+        booking_ids = booking['ids']
+        user_id = booking['created_by']
+        group_name = booking['group_name']
+        start_time = booking['start_time']
+        formatted_date = format_booking_date(booking)
+        confirmation_message = format_confirmation_message(booking)
+        decline_message = format_decline_message(booking)
         cancellation_message = f"🚫 Ваша бронь для группы «{group_name or 'неизвестная группа'}» {formatted_date} в {start_time} была отменена администратором по вашей заявке."
         if action == "confirm":
-            confirm_booking(booking_ids)
-            try:
-                main_bot.send_message(user_id, confirmation_message)
-            except Exception as e:
-                print(f"[Error] Не удалось отправить сообщение пользователю {user_id}: {e}")
-            admin_bot.answer_callback_query(call.id, "✅ Бронь подтверждена.")
+            applied = confirm_booking(booking_ids, [("main", user_id, confirmation_message, {})], created_by=user_id)
+            result = "✅ Бронь подтверждена."
         elif action == "reject":
-            reject_booking(booking_ids)
-            try:
-                main_bot.send_message(user_id, decline_message)
-            except Exception as e:
-                print(f"[Error] Не удалось отправить сообщение пользователю {user_id}: {e}")
-            admin_bot.answer_callback_query(call.id, "❌ Бронь отклонена.")
+            applied = reject_booking(booking_ids, [("main", user_id, decline_message, {})], created_by=user_id, statuses=(1,))
+            result = "❌ Бронь отклонена."
         elif action == "cancel":
-            notify_subscribers_for_cancellation({"ids": booking_ids}, main_bot)
-            reject_booking(booking_ids)
-            try:
-                main_bot.send_message(user_id, cancellation_message)
-            except Exception as e:
-                print(f"[Error] Не удалось уведомить пользователя {user_id}: {e}")
-            admin_bot.answer_callback_query(call.id, "🚫 Бронь успешно отменена.")
+            applied = reject_booking(booking_ids, [("main", user_id, cancellation_message, {})], created_by=user_id, notify_subscribers=subscriber_notifications)
+            result = "🚫 Бронь успешно отменена."
+        else:
+            raise Exception(f"Неизвестное действие: {action}")
+        admin_bot.answer_callback_query(call.id, result if applied else STALE_BOOKING_MESSAGE)
     except Exception as e:
         print(f"[Error] Не удалось обработать callback: {e}")
+        if token:
+            release_booking_token(token)
         admin_bot.answer_callback_query(call.id, "❌ Ошибка при обработке брони.")
     finally:
-        try:
-            admin_bot.edit_message_reply_markup(
-                chat_id=call.message.chat.id,
-                message_id=call.message.message_id,
-                reply_markup=None
-            )
-        except Exception as e:
-            print(f"[Error] Не удалось удалить клавиатуру: {e}")
+        remove_callback_keyboard(call)
+
+def remove_callback_keyboard(call):
+    try:
+        admin_bot.edit_message_reply_markup(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=None
+        )
+    except Exception as e:
+        print(f"[Error] Не удалось удалить клавиатуру: {e}")
 
 if __name__ == "__main__":
+    init_db()
+    start_outbox_dispatcher({"main": main_bot, "admin": admin_bot})
     admin_bot.polling(none_stop=True)
\ No newline at end of file
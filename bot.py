@@ -1,18 +1,26 @@
 import os
 import re
+import math
 import time
-import sqlite3
+import functools
 import telebot
 import logging
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from telebot import types
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-from lib.schedule_generator import create_schedule_grid_image
-from lib.utils import is_admin, reset_user_state, format_date, format_date_to_db, get_hour_word, update_booking_status, book_slots, validate_input
-from lib.schedule_tasks import get_booked_days_filtered, add_subscriber_to_slot, get_grouped_bookings_for_cancellation, get_schedule_for_day, get_free_days
-from lib.keyboards import create_confirmation_keyboard, create_cancellation_keyboard, send_date_selection_keyboard
+from lib.utils import is_admin, reset_user_state, format_date, format_date_to_db, format_hours, update_booking_status, book_slots, is_range_free, validate_input
+from lib.schedule_tasks import get_booked_days_filtered, get_slot_subscriptions, add_subscriber_to_slot, get_cancellable_booking_groups, get_schedule_for_day, get_free_days, get_free_slot_counts, get_booking_dates
+from lib.keyboards import create_confirmation_keyboard, create_cancellation_keyboard, send_date_selection_keyboard, create_free_days_calendar, MAIN_MENU_KEYBOARD, CALENDAR_KEYBOARD, SUBSCRIBE_CONTINUE_KEYBOARD, BOOKING_TYPE_KEYBOARD, COMMENT_PROMPT_KEYBOARD, BOOKING_CONTINUE_KEYBOARD, REMOVE_KEYBOARD, ROOM_SELECTION_KEYBOARD, TIME_KEYBOARD_WIDTH
+from lib.static_files import read_static_file
+from lib.timeslots import SLOT_MINUTES, SLOTS_PER_HOUR, slot_index, slot_time, slot_ranges, parse_duration, parse_day_label
+from lib.rooms import ROOM_IDS, DEFAULT_ROOM, has_multiple_rooms, get_room_name, get_room_by_name, get_room_caption
 from lib.db_init import init_db
+from lib.outbound import send_message
+from lib.outbox import start_outbox_dispatcher
+from lib.telegram_files import send_schedule_photo
+from lib.router import MessageRouter, get_state_step
+from lib.rate_limit import RateLimiter, ChatRateLimitMiddleware, CHEAP_LIMIT, EXPENSIVE_LIMIT, BOOKING_LIMIT
 
 logging.basicConfig(level=logging.INFO)
 load_dotenv()
@@ -21,30 +29,47 @@ MAIN_BOT_TOKEN = os.getenv("MAIN_BOT_TOKEN")
 ADMIN_BOT_TOKEN = os.getenv("ADMIN_BOT_TOKEN")
 ADMIN_IDS = list(map(int, os.getenv("ADMIN_IDS", "").split(",")))
 
-main_bot = telebot.TeleBot(MAIN_BOT_TOKEN)
+main_bot = telebot.TeleBot(MAIN_BOT_TOKEN, use_class_middlewares=True)
 admin_bot = telebot.TeleBot(ADMIN_BOT_TOKEN)
 
 user_states = {}
-
-@main_bot.message_handler(func=lambda msg: msg.text == "Посмотреть прайс")
+router = MessageRouter(lambda chat_id: get_state_step(user_states, chat_id))
+
+rate_limiter = RateLimiter({"cheap": CHEAP_LIMIT, "expensive": EXPENSIVE_LIMIT, "booking": BOOKING_LIMIT})
+main_bot.setup_middleware(ChatRateLimitMiddleware(main_bot, rate_limiter, "Слишком много сообщений. Пожалуйста, подождите немного."))
+
+def limited(bucket):
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(message):
+            allowed, should_warn, retry_after = rate_limiter.acquire(message.chat.id, bucket)
+            if allowed:
+                return handler(message)
+            if should_warn:
+                main_bot.send_message(message.chat.id, f"Слишком частые запросы. Попробуйте через {math.ceil(retry_after)} сек.")
+        return wrapper
+    return decorator
+
+# Viewing the schedule and submitting a booking are limited separately, so
+# browsing the schedule never blocks the final step of a booking.
+expensive = limited("expensive")
+booking_submit = limited("booking")
+
+DURATION_PROMPT = "Сколько часов будет занято?\nУкажите числом."
+if SLOTS_PER_HOUR > 1:
+    DURATION_PROMPT += f"\nМожно с шагом {SLOT_MINUTES} минут, например 1,5."
+
+def get_price_list():
+    return read_static_file('price.txt', "Информация о прайсе временно недоступна.")
+
+@router.text("Посмотреть прайс")
 def show_price_list(message):
-    try:
-        with open('price.txt', 'r', encoding='utf-8') as file:
-            price_list = file.read().strip()
-    except FileNotFoundError:
-        price_list = "Информация о прайсе временно недоступна."
-    main_bot.send_message(message.chat.id, price_list)
+    main_bot.send_message(message.chat.id, get_price_list())
     reset_user_state(message.chat.id, user_states)
     show_menu(message)
 
 def show_menu(message):
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(types.KeyboardButton("Посмотреть расписание"))
-    keyboard.add(types.KeyboardButton("Забронировать время"))
-    keyboard.add(types.KeyboardButton("Отменить бронь"))
-    keyboard.add(types.KeyboardButton("Быть в курсе, если освободится время"))
-    keyboard.add(types.KeyboardButton("Посмотреть прайс"))
-    main_bot.send_message(message.chat.id, "(Это БЕТА-версия бота. Большая просьба обо всех найденных неисправностях и пожеланиях по улучшениям сообщать @cyberocalypse или @seven2221)\n\nВыберите действие:", reply_markup=keyboard)
+    main_bot.send_message(message.chat.id, "(Это БЕТА-версия бота. Большая просьба обо всех найденных неисправностях и пожеланиях по улучшениям сообщать @cyberocalypse или @seven2221)\n\nВыберите действие:", reply_markup=MAIN_MENU_KEYBOARD)
     reset_user_state(message.chat.id, user_states)
 
 @main_bot.message_handler(commands=['start'])
@@ -52,24 +77,69 @@ def start(message):
     main_bot.set_my_commands([telebot.types.BotCommand("/start", "Главное меню")])
     show_menu(message)
 
-@main_bot.message_handler(func=lambda msg: msg.text == "Забронировать время")
+@router.text("Забронировать время")
 def book_time(message):
     reset_user_state(message.chat.id, user_states)
-    show_free_days(message)
+    start_booking(message)
+
+def start_booking(message):
+    if has_multiple_rooms():
+        main_bot.send_message(message.chat.id, "Выберите зал:", reply_markup=ROOM_SELECTION_KEYBOARD)
+        user_states[message.chat.id] = 'waiting_for_room'
+    else:
+        show_free_days(message, DEFAULT_ROOM)
+
+def get_selected_room(chat_id):
+    return user_states.get(f"{chat_id}_room", DEFAULT_ROOM)
+
+@router.step('waiting_for_room')
+def handle_room_selection(message):
+    if message.text == "На главную":
+        return_to_main_menu(message)
+        return
+    room = get_room_by_name(message.text.strip())
+    if room is None:
+        main_bot.send_message(message.chat.id, "Выберите зал из предложенных.")
+        return
+    show_free_days(message, room)
 
-@main_bot.message_handler(func=lambda msg: msg.text == "Посмотреть расписание")
+@router.text("Посмотреть расписание")
+@expensive
 def view_schedule(message):
-    path = create_schedule_grid_image(message.chat.id)
-    with open(path, "rb") as img:
-        main_bot.send_photo(message.chat.id, img, caption="Расписание на ближайшие 28 дней:")
-    os.remove(path)
+    from lib.schedule_generator import create_schedule_grid_image, get_schedule_grid_variant
+    for room in ROOM_IDS:
+        send_schedule_photo(
+            main_bot, "main", message.chat.id,
+            get_schedule_grid_variant(message.chat.id, room=room),
+            lambda: create_schedule_grid_image(message.chat.id, room=room),
+            caption=f"Расписание на ближайшие 28 дней{get_room_caption(room)}:"
+        )
     reset_user_state(message.chat.id, user_states)
     show_menu(message)
 
-@main_bot.message_handler(func=lambda msg: msg.text == "Быть в курсе, если освободится время")
+@router.text("Быть в курсе, если освободится время")
 def subscribe_to_free_slots(message):
     reset_user_state(message.chat.id, user_states)
-    booked_days = get_booked_days_filtered()
+    if has_multiple_rooms():
+        main_bot.send_message(message.chat.id, "Выберите зал:", reply_markup=ROOM_SELECTION_KEYBOARD)
+        user_states[message.chat.id] = 'waiting_for_subscribe_room'
+    else:
+        show_booked_days(message, DEFAULT_ROOM)
+
+@router.step('waiting_for_subscribe_room')
+def handle_subscribe_room_selection(message):
+    if message.text == "На главную":
+        return_to_main_menu(message)
+        return
+    room = get_room_by_name(message.text.strip())
+    if room is None:
+        main_bot.send_message(message.chat.id, "Выберите зал из предложенных.")
+        return
+    show_booked_days(message, room)
+
+def show_booked_days(message, room):
+    user_states[f"{message.chat.id}_room"] = room
+    booked_days = get_booked_days_filtered(room)
     if not booked_days:
         main_bot.send_message(message.chat.id, "Нет забронированных дней.")
         return
@@ -79,105 +149,132 @@ def subscribe_to_free_slots(message):
     main_bot.send_message(message.chat.id, "Выберите день:", reply_markup=keyboard)
     user_states[message.chat.id] = 'waiting_for_subscribe_day'
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_subscribe_day')
+@router.step('waiting_for_subscribe_day')
 def handle_subscribe_day_selection(message):
     if message.text == "На главную":
         return_to_main_menu(message)
         return
     try:
-        selected_day = datetime.strptime(message.text.split()[0], '%d.%m').replace(year=datetime.now().year).strftime('%Y-%m-%d')
+        selected_day = parse_day_label(message.text)
     except ValueError:
         main_bot.send_message(message.chat.id, "Неверный формат. Попробуйте снова.")
-        subscribe_to_free_slots(message)
+        show_booked_days(message, get_selected_room(message.chat.id))
         return
     chat_id = message.chat.id
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
+    room = get_selected_room(chat_id)
     current_date = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("SELECT time, subscribed_users FROM slots WHERE date = ? AND status IN (1, 2)  AND date >= ?", (selected_day, current_date))
-    rows = cursor.fetchall()
-    conn.close()
+    rows = get_slot_subscriptions(selected_day, room) if selected_day >= current_date else []
     if not rows:
         main_bot.send_message(message.chat.id, "В этот день нет подходящих слотов.")
         return
     available_times = []
     for time, subs in rows:
         subs_list = subs.split(',') if subs else []
-        if str(chat_id) not in subs_list:
+        if str(chat_id) not in subs_list and time not in available_times:
             available_times.append(time)
     if not available_times:
         main_bot.send_message(message.chat.id, "Вы уже подписаны на все доступные слоты этого дня.")
         return
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=3)
+    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=TIME_KEYBOARD_WIDTH)
     keyboard.add(*[types.KeyboardButton(t) for t in available_times])
     keyboard.add(types.KeyboardButton("Выбрать другой день"))
     main_bot.send_message(message.chat.id, "Выберите время, на которое хотите подписаться:", reply_markup=keyboard)
     user_states[message.chat.id] = 'waiting_for_subscribe_time'
     user_states[f"{message.chat.id}_subscribe_day"] = selected_day
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_subscribe_time')
+@router.step('waiting_for_subscribe_time')
 def handle_subscribe_time_selection(message):
     chat_id = message.chat.id
     selected_day = user_states.get(f"{chat_id}_subscribe_day")
+    room = get_selected_room(chat_id)
     if message.text == "Выбрать другой день":
         reset_user_state(chat_id, user_states)
-        subscribe_to_free_slots(message)
+        show_booked_days(message, room)
         return
     if message.text == "На главную":
         return_to_main_menu(message)
         return
     selected_time = message.text.strip()
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT status FROM slots WHERE date = ? AND time = ?", (selected_day, selected_time))
-    result = cursor.fetchone()
-    conn.close()
-    if not result or result[0] not in (1, 2):
+    if not any(time == selected_time for time, _ in get_slot_subscriptions(selected_day, room)):
         main_bot.send_message(chat_id, "Это время недоступно.")
         return
-    add_subscriber_to_slot(selected_day, selected_time, chat_id)
+    add_subscriber_to_slot(selected_day, selected_time, chat_id, room)
     main_bot.send_message(chat_id, "Спасибо! Мы оповестим вас, если это время освободится.")
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    keyboard.row(
-        types.KeyboardButton("Оповестить про другое время"),
-        types.KeyboardButton("Вернуться на главную")
-    )
-    main_bot.send_message(chat_id, "Продолжить?", reply_markup=keyboard)
+    main_bot.send_message(chat_id, "Продолжить?", reply_markup=SUBSCRIBE_CONTINUE_KEYBOARD)
     reset_user_state(chat_id, user_states)
 
-@main_bot.message_handler(func=lambda msg: msg.text == "Оповестить про другое время")
+@router.text("Оповестить про другое время")
 def book_another_time(message):
     reset_user_state(message.chat.id, user_states)
     subscribe_to_free_slots(message)
 
-def show_free_days(message):
-    free_days = get_free_days()
+def show_free_days(message, room=None):
+    if room is None:
+        room = get_selected_room(message.chat.id)
+    user_states[f"{message.chat.id}_room"] = room
+    free_days = get_free_days(room)
     if not free_days:
         main_bot.send_message(message.chat.id, "Все дни заняты.")
         return
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(*[types.KeyboardButton(format_date(day)) for day in free_days])
-    keyboard.add(types.KeyboardButton("На главную"))
-    main_bot.send_message(message.chat.id, "Свободные дни:", reply_markup=keyboard)
+    main_bot.send_message(message.chat.id, "Выберите день в календаре. Рядом с датой — сколько часов свободно.", reply_markup=CALENDAR_KEYBOARD)
+    main_bot.send_message(message.chat.id, "Свободные дни:", reply_markup=create_free_days_calendar(room, free_days[0][:7], get_free_slot_counts(room), get_booking_dates()))
     user_states[message.chat.id] = 'waiting_for_day'
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_day')
+@main_bot.callback_query_handler(func=lambda call: call.data.startswith("cal:"))
+def handle_calendar_navigation(call):
+    value = call.data.split(":", 1)[1]
+    if value == "full":
+        main_bot.answer_callback_query(call.id, "В этот день всё занято.")
+        return
+    if value == "-":
+        main_bot.answer_callback_query(call.id)
+        return
+    room, month = value.split(":")
+    room = int(room)
+    dates = get_booking_dates()
+    if month not in {date[:7] for date in dates}:
+        main_bot.answer_callback_query(call.id, "Календарь устарел, выберите день заново.")
+        return
+    main_bot.answer_callback_query(call.id)
+    try:
+        main_bot.edit_message_reply_markup(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            reply_markup=create_free_days_calendar(room, month, get_free_slot_counts(room), dates)
+        )
+    except Exception as e:
+        print(f"[Error] Can't switch calendar month: {e}")
+
+@main_bot.callback_query_handler(func=lambda call: call.data.startswith("cal_day:"))
+def handle_calendar_day(call):
+    _, room, selected_day = call.data.split(":")
+    room = int(room)
+    chat_id = call.message.chat.id
+    main_bot.answer_callback_query(call.id)
+    reset_user_state(chat_id, user_states)
+    user_states[f"{chat_id}_room"] = room
+    show_day_times(call.message, selected_day)
+
+@router.step('waiting_for_day')
 def handle_day_selection(message):
     if message.text == "На главную":
         return_to_main_menu(message)
         return
     try:
-        selected_day = datetime.strptime(message.text.split()[0], '%d.%m').replace(year=datetime.now().year).strftime('%Y-%m-%d')
+        selected_day = parse_day_label(message.text)
     except ValueError:
-        main_bot.send_message(message.chat.id, "Неверный формат. Попробуйте снова.")
-        show_free_days(message)
+        main_bot.send_message(message.chat.id, "Неверный формат. Выберите день в календаре.")
         return
-    if selected_day not in get_free_days():
+    show_day_times(message, selected_day)
+
+def show_day_times(message, selected_day):
+    chat_id = message.chat.id
+    room = get_selected_room(chat_id)
+    if selected_day not in get_free_days(room):
         main_bot.send_message(message.chat.id, "День недоступен. Попробуйте другой.")
         show_free_days(message)
         return
-    chat_id = message.chat.id
-    schedule = get_schedule_for_day(selected_day, chat_id)
+    schedule = get_schedule_for_day(selected_day, chat_id, room)
     filtered_all = [(t, b, g) for t, b, g in schedule if 11 <= int(t.split(':')[0]) < 24]
     today = datetime.now().strftime("%Y-%m-%d")
     current_hour = datetime.now().hour
@@ -192,6 +289,8 @@ def handle_day_selection(message):
         else:
             lines.append(f"{time_str} -")
     formatted_date = format_date(selected_day)
+    if has_multiple_rooms():
+        formatted_date = f"{formatted_date}, {get_room_name(room)}"
     schedule_text = f"Расписание на {formatted_date}:\n" + "\n".join(lines)
     main_bot.send_message(chat_id, schedule_text, parse_mode='Markdown')
     available_times = [t for t, b, _ in filtered_all if not b]
@@ -199,71 +298,59 @@ def handle_day_selection(message):
         main_bot.send_message(chat_id, "На этот день нет свободного времени.")
         show_free_days(message)
         return
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=3)
+    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=TIME_KEYBOARD_WIDTH)
     keyboard.add(*[types.KeyboardButton(t) for t in available_times])
     keyboard.add(types.KeyboardButton("Выбрать другой день"))
     main_bot.send_message(chat_id, "Выберите время:", reply_markup=keyboard)
     user_states[chat_id] = 'waiting_for_time'
     user_states[f"{chat_id}_selected_day"] = selected_day
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_time')
+@router.step('waiting_for_time')
 def handle_time_selection(message):
     chat_id = message.chat.id
     selected_day = user_states.get(f"{chat_id}_selected_day")
+    room = get_selected_room(chat_id)
     if message.text == "Выбрать другой день":
         reset_user_state(chat_id, user_states)
-        show_free_days(message)
+        show_free_days(message, room)
         return
     selected_time = message.text.strip()
-    schedule = get_schedule_for_day(selected_day)
+    schedule = get_schedule_for_day(selected_day, room=room)
     available_times = [t for t, b, _ in schedule if not b]
     if selected_time not in available_times:
         main_bot.send_message(chat_id, "Время занято или недоступно. Попробуйте снова.")
         return
-    main_bot.send_message(chat_id, "Сколько часов будет занято?\nУкажите числом.", reply_markup=types.ReplyKeyboardRemove())
+    main_bot.send_message(chat_id, DURATION_PROMPT, reply_markup=REMOVE_KEYBOARD)
     user_states[chat_id] = 'waiting_for_hours'
     user_states[f"{chat_id}_selected_time"] = selected_time
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_hours')
+@router.step('waiting_for_hours')
 def handle_hours_input(message):
     chat_id = message.chat.id
-    try:
-        hours = int(message.text.strip())
-        if hours <= 0:
-            raise ValueError
-    except ValueError:
+    slot_count = parse_duration(message.text)
+    if slot_count is None:
         main_bot.send_message(chat_id, "Введите корректное количество часов.")
         return
     selected_day = user_states.get(f"{chat_id}_selected_day")
     selected_time = user_states.get(f"{chat_id}_selected_time")
-    start_hour = int(selected_time.split(":")[0])
-    if hours > 8:
+    room = get_selected_room(chat_id)
+    if slot_count > 8 * SLOTS_PER_HOUR:
         main_bot.send_message(chat_id, "Максимум можно забронировать 8 часов.")
         return
-    schedule = get_schedule_for_day(selected_day)
-    schedule_dict = {t: b for t, b, _ in schedule}
     conflict = False
-    for i in range(hours):
-        current_hour = start_hour + i
-        days_passed = current_hour // 24
-        hour_in_day = current_hour % 24
-        current_date = datetime.strptime(selected_day, "%Y-%m-%d") + timedelta(days=days_passed)
-        current_date_str = current_date.strftime("%Y-%m-%d")
-        full_schedule = get_schedule_for_day(current_date_str)
-        schedule_dict = {t: b for t, b, _ in full_schedule}
-        time_str = f"{hour_in_day:02d}:00"
-        if schedule_dict.get(time_str, 0) != 0:
+    for slot_date, first_time, last_time in slot_ranges(selected_day, selected_time, slot_count):
+        if any(b for t, b, _ in get_schedule_for_day(slot_date, room=room) if first_time <= t <= last_time):
             conflict = True
             break
     if conflict:
         main_bot.send_message(chat_id, "Этот временной интервал уже занят. Выберите другое время.")
         show_free_days(message)
         return
-    main_bot.send_message(chat_id, "Введите название группы:", reply_markup=types.ReplyKeyboardRemove())
+    main_bot.send_message(chat_id, "Введите название группы:", reply_markup=REMOVE_KEYBOARD)
     user_states[chat_id] = 'waiting_for_group_name'
-    user_states[f"{chat_id}_hours"] = hours
+    user_states[f"{chat_id}_slot_count"] = slot_count
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_group_name')
+@router.step('waiting_for_group_name')
 def handle_group_name_input(message):
     chat_id = message.chat.id
     group_name = message.text.strip()
@@ -274,7 +361,7 @@ def handle_group_name_input(message):
     user_states[chat_id] = 'waiting_for_contact'
     main_bot.send_message(chat_id, "Введите ваш номер телефона, тег в телеграмме или укажите другой способ связаться с вами.\n\nМы сообщим о непредвиденных изменениях графика работы репетиционной базы.")
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_contact')
+@router.step('waiting_for_contact')
 def handle_contact_input(message):
     chat_id = message.chat.id
     contact_info = message.text.strip()
@@ -283,11 +370,9 @@ def handle_contact_input(message):
         return
     user_states[f"{chat_id}_contact_info"] = contact_info
     user_states[chat_id] = 'waiting_for_booking_type'
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add("Репетиция", "Запись", "Другое")
-    main_bot.send_message(chat_id, "Тип брони.\n\nКак планируете использовать пространство репетиционной базы в бронируемое время?", reply_markup=keyboard)
+    main_bot.send_message(chat_id, "Тип брони.\n\nКак планируете использовать пространство репетиционной базы в бронируемое время?", reply_markup=BOOKING_TYPE_KEYBOARD)
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_booking_type')
+@router.step('waiting_for_booking_type')
 def handle_booking_type_selection(message):
     chat_id = message.chat.id
     allowed_types = ["Репетиция", "Запись", "Другое"]
@@ -296,14 +381,14 @@ def handle_booking_type_selection(message):
         main_bot.send_message(chat_id, "Пожалуйста, выберите тип брони из предложенных.")
         return
     if message.text == "Другое":
-        main_bot.send_message(chat_id, "Чем планируете заниматься?", reply_markup=types.ReplyKeyboardRemove())
+        main_bot.send_message(chat_id, "Чем планируете заниматься?", reply_markup=REMOVE_KEYBOARD)
         user_states[chat_id] = 'waiting_for_custom_booking_type'
     else:
         user_states[f"{chat_id}_booking_type"] = message.text.strip()
         user_states[chat_id] = 'waiting_for_comment'
         show_comment_prompt(chat_id)
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_custom_booking_type')
+@router.step('waiting_for_custom_booking_type')
 def handle_custom_booking_type(message):
     chat_id = message.chat.id
     booking_type = message.text.strip()
@@ -315,25 +400,16 @@ def handle_custom_booking_type(message):
     show_comment_prompt(chat_id)
 
 def show_comment_prompt(chat_id):
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    keyboard.row(
-        types.KeyboardButton("Прайс"),
-        types.KeyboardButton("Ок")
-    )
-    main_bot.send_message(chat_id, "Если вам необходимы какие-либо дополнительные услуги из нашего прайса, пожалуйста, укажите их в комментарии.\n\nЕсли доп.услуги не требуются, нажмите 'Ок'.", reply_markup=keyboard)
+    main_bot.send_message(chat_id, "Если вам необходимы какие-либо дополнительные услуги из нашего прайса, пожалуйста, укажите их в комментарии.\n\nЕсли доп.услуги не требуются, нажмите 'Ок'.", reply_markup=COMMENT_PROMPT_KEYBOARD)
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_comment' and msg.text == "Прайс")
+@router.step('waiting_for_comment', text="Прайс")
 def show_price_list_during_booking(message):
     chat_id = message.chat.id
-    try:
-        with open('price.txt', 'r', encoding='utf-8') as file:
-            price_list = file.read().strip()
-    except FileNotFoundError:
-        price_list = "Информация о прайсе временно недоступна."
-    main_bot.send_message(chat_id, price_list)
+    main_bot.send_message(chat_id, get_price_list())
     show_comment_prompt(chat_id)
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id) == 'waiting_for_comment')
+@router.step('waiting_for_comment')
+@booking_submit
 def handle_comment_input(message):
     chat_id = message.chat.id
     if message.text == "Прайс":
@@ -347,63 +423,17 @@ def handle_comment_input(message):
         return
     selected_day = user_states.get(f"{chat_id}_selected_day")
     selected_time = user_states.get(f"{chat_id}_selected_time")
-    hours = user_states.get(f"{chat_id}_hours")
-    start_hour = int(selected_time.split(":")[0])
-    date_obj = datetime.strptime(selected_day, "%Y-%m-%d")
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    conflict = False
-    for i in range(hours):
-        current_hour = start_hour + i
-        days_passed = current_hour // 24
-        hour_in_day = current_hour % 24
-        slot_date = (date_obj + timedelta(days=days_passed)).strftime("%Y-%m-%d")
-        slot_time = f"{hour_in_day:02d}:00"
-        cursor.execute("SELECT status FROM slots WHERE date = ? AND time = ?", (slot_date, slot_time))
-        result = cursor.fetchone()
-        if result and result[0] != 0:
-            conflict = True
-            break
-    conn.close()
-    if conflict:
-        main_bot.send_message(chat_id, "Это время уже занято другим пользователем. Пожалуйста, выберите другое время.")
-        reset_user_state(chat_id, user_states)
-        show_menu(message)
+    slot_count = user_states.get(f"{chat_id}_slot_count")
+    room = get_selected_room(chat_id)
+    if not is_range_free(selected_day, selected_time, slot_count, room):
+        reject_taken_slot(message)
         return
     group_name = user_states.get(f"{chat_id}_group_name")
     booking_type = user_states.get(f"{chat_id}_booking_type")
     contact_info = user_states.get(f"{chat_id}_contact_info")
-    start_datetime = datetime.combine(date_obj.date(), datetime.min.time()).replace(hour=start_hour, minute=0)
-    end_datetime = start_datetime + timedelta(hours=hours)
-    end_time = f"{end_datetime.hour}:00"
-    book_slots(selected_day, selected_time, hours, chat_id, group_name, booking_type, comment, contact_info)
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    booking_ids = []
-    current_date = datetime.strptime(selected_day, "%Y-%m-%d")
-    for i in range(hours):
-        current_hour = start_hour + i
-        days_passed = current_hour // 24
-        hour_in_day = current_hour % 24
-        slot_date = (current_date + timedelta(days=days_passed)).strftime("%Y-%m-%d")
-        slot_time = f"{hour_in_day:02d}:00"
-        cursor.execute("SELECT id FROM slots WHERE date = ? AND time = ? AND user_id = ?", (slot_date, slot_time, chat_id))
-        row = cursor.fetchone()
-        if row:
-            booking_ids.append(row[0])
-    conn.close()
-    try:
-        formatted_date = format_date(selected_day).replace(" ", ".")[:-3]
-    except ValueError:
-        formatted_date = selected_day
-    main_bot.send_message(
-        chat_id,
-        f"Спасибо! 👍\n"
-        f"Вы забронировали *{hours}* {get_hour_word(hours)} с *{selected_time} по {end_time}* *{formatted_date}*\n"
-        f"Группа: *{group_name}*\n"
-        f"Пожалуйста, ожидайте подтверждения брони администратором.",
-        parse_mode='Markdown'
-    )
+    end_time = slot_time(slot_index(selected_day, selected_time) + slot_count)
+    room_line = f"Зал: *{get_room_name(room)}*\n" if has_multiple_rooms() else ""
+    room_note = f"_Зал:_ *{get_room_name(room)}*\n" if has_multiple_rooms() else ""
     if message.from_user.username:
         mention = f"@{message.from_user.username}"
     elif contact_info.startswith('@'):
@@ -416,64 +446,69 @@ def handle_comment_input(message):
         f"🔔 *Новая бронь!*\n"
         f"_Дата:_ *{selected_day}*\n"
         f"_Время:_ *{selected_time}-{end_time}*\n"
+        f"{room_note}"
         f"_Группа:_ *{group_name}*\n"
         f"_Тип:_ *{booking_type}*\n"
         f"_Комментарий:_ {comment}\n"
         f"_Контакт:_ {contact_info}\n"
         f"_Создатель:_ {mention}"
     )
-    for admin_id in ADMIN_IDS:
-        try:
-            admin_bot.send_message(
-                admin_id,
-                note,
-                parse_mode='Markdown',
-                reply_markup=create_confirmation_keyboard(selected_day, selected_time, booking_ids)
-            )
-        except Exception as e:
-            print(f"[Error] Can't send message to admin {admin_id}: {e}")
-    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(types.KeyboardButton("Забронировать другое время"))
-    keyboard.add(types.KeyboardButton("Вернуться на главную"))
-    main_bot.send_message(chat_id, "Продолжить?", reply_markup=keyboard)
+    def admin_notifications(booking_ids, cursor):
+        confirmation_keyboard = create_confirmation_keyboard(booking_ids, cursor=cursor)
+        return [("admin", admin_id, note, {"parse_mode": "Markdown", "reply_markup": confirmation_keyboard}) for admin_id in ADMIN_IDS]
+    if not book_slots(selected_day, selected_time, slot_count, chat_id, group_name, booking_type, comment, contact_info, room, notify=admin_notifications):
+        reject_taken_slot(message)
+        return
+    try:
+        formatted_date = format_date(selected_day).replace(" ", ".")[:-3]
+    except ValueError:
+        formatted_date = selected_day
+    main_bot.send_message(
+        chat_id,
+        f"Спасибо! 👍\n"
+        f"Вы забронировали *{format_hours(slot_count)}* с *{selected_time} по {end_time}* *{formatted_date}*\n"
+        f"{room_line}"
+        f"Группа: *{group_name}*\n"
+        f"Пожалуйста, ожидайте подтверждения брони администратором.",
+        parse_mode='Markdown'
+    )
+    main_bot.send_message(chat_id, "Продолжить?", reply_markup=BOOKING_CONTINUE_KEYBOARD)
     reset_user_state(chat_id, user_states)
 
-@main_bot.message_handler(func=lambda msg: msg.text == "Забронировать другое время")
+def reject_taken_slot(message):
+    main_bot.send_message(message.chat.id, "Это время уже занято другим пользователем. Пожалуйста, выберите другое время.")
+    reset_user_state(message.chat.id, user_states)
+    show_menu(message)
+
+@router.text("Забронировать другое время")
 def book_another_time(message):
     reset_user_state(message.chat.id, user_states)
-    show_free_days(message)
+    start_booking(message)
 
-@main_bot.message_handler(func=lambda msg: msg.text == "Вернуться на главную")
+@router.text("Вернуться на главную")
 def return_to_main_menu(message):
     reset_user_state(message.chat.id, user_states) 
     show_menu(message)
 
 
-@main_bot.message_handler(func=lambda msg: msg.text == "Отменить бронь")
+@router.text("Отменить бронь")
 def handle_cancel_booking(message):
     chat_id = message.chat.id
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
     today = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("SELECT DISTINCT date FROM slots WHERE status IN (1, 2) AND user_id = ? AND date >= ? ORDER BY date", (chat_id, today))
-    all_dates = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    valid_dates = []
-    for date_str in all_dates:
-        bookings = get_grouped_bookings_for_cancellation(date_str, chat_id)
-        if bookings:
-            valid_dates.append(date_str)
+    bookings_by_date = get_cancellable_booking_groups(today, created_by=chat_id)
+    valid_dates = sorted(bookings_by_date)
     if not valid_dates:
         main_bot.send_message(chat_id, "У вас нет активных броней.")
         show_menu(message)
         return
     user_states[chat_id] = {
         "step": "choose_date_for_cancellation",
-        "valid_dates": valid_dates
+        "valid_dates": valid_dates,
+        "bookings_by_date": bookings_by_date
     }
     send_date_selection_keyboard(chat_id, valid_dates, main_bot)
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id, {}).get("step") == "choose_date_for_cancellation")
+@router.step("choose_date_for_cancellation")
 def handle_date_chosen_for_cancellation(message):
     chat_id = message.chat.id
     if message.text == "На главную":
@@ -489,17 +524,16 @@ def handle_date_chosen_for_cancellation(message):
             main_bot.send_message(chat_id, "Неверный формат даты. Попробуйте снова.")
             send_date_selection_keyboard(chat_id, user_states[chat_id]["valid_dates"], main_bot)
             return
-    valid_dates = [datetime.strptime(d, "%Y-%m-%d").strftime("%Y-%m-%d") for d in user_states[chat_id]["valid_dates"]]
+    valid_dates = user_states[chat_id]["valid_dates"]
     if selected_date not in valid_dates:
         main_bot.send_message(chat_id, "Выберите одну из предложенных дат.")
         return
-    bookings = get_grouped_bookings_for_cancellation(selected_date, chat_id)
+    bookings = user_states[chat_id]["bookings_by_date"][selected_date]
     now = datetime.now()
     deadline = now + timedelta(hours=24)
     filtered_bookings = []
     for booking in bookings:
-        booking_start = datetime.strptime(f"{booking['date_str']} {booking['start_time'].strftime('%H:%M')}", "%Y-%m-%d %H:%M")
-        if booking_start > deadline:
+        if booking['start_time'] > deadline:
             filtered_bookings.append(booking)
     if not filtered_bookings:
         main_bot.send_message(chat_id, "У вас нет броней, доступных для отмены в этот день.\nОтмена возможна только более чем за 24 часа до начала брони.\n\nПожалуйста, свяжитесь с админом: @cyberocalypse")
@@ -526,7 +560,7 @@ def send_cancellation_options(chat_id, bookings):
     markup.row(*row)
     main_bot.send_message(chat_id, "Выберите бронь для отмены:", reply_markup=markup)
 
-@main_bot.message_handler(func=lambda msg: user_states.get(msg.chat.id, {}).get("step") == "choose_booking_for_cancellation")
+@router.step("choose_booking_for_cancellation")
 def handle_user_choose_booking_for_cancellation(message):
     chat_id = message.chat.id
     if message.text == "На главную":
@@ -576,20 +610,28 @@ def handle_user_choose_booking_for_cancellation(message):
         f"_Группа:_ *{group_name}*\n"
         f"_Создатель:_ *{mention}*"
     )
+    cancellation_keyboard = create_cancellation_keyboard(booking_ids)
     for admin_id in ADMIN_IDS:
         try:
-            admin_bot.send_message(
+            send_message(
+                admin_bot,
                 admin_id,
                 note,
                 parse_mode='Markdown',
-                reply_markup=create_cancellation_keyboard(date_str, start_time, booking_ids)
+                reply_markup=cancellation_keyboard
             )
         except Exception as e:
             print(f"[Error] Can't send cancellation request to admin {admin_id}: {e}")
     main_bot.send_message(chat_id, "Запрос на отмену брони отправлен администратору. Пожалуйста, ожидайте подтверждения.")
     show_menu(message)
 
+@main_bot.message_handler(func=lambda msg: True)
+def route_message(message):
+    router.dispatch(message)
+
 if __name__ == "__main__":
-    if not os.path.exists('db/bookings.db'):
-        init_db()
+    init_db()
+    start_outbox_dispatcher({"main": main_bot, "admin": admin_bot})
+    from lib.schedule_generator import start_prerender_worker
+    start_prerender_worker()
     main_bot.polling(none_stop=True)
\ No newline at end of file
@@ -0,0 +1,60 @@
+import time
+import threading
+from datetime import datetime
+from lib.db import enable_pool
+from lib.db_init import init_db
+from lib.outbound import start_outbound_worker
+from lib.outbox import start_outbox_dispatcher
+from lib.timeslots import SLOT_MINUTES
+import bot
+import admin
+import reminder
+import db_updater
+from lib.schedule_generator import start_prerender_worker
+
+SCHEDULER_INTERVAL = 20
+
+def run_polling(telegram_bot):
+    while True:
+        try:
+            telegram_bot.polling(none_stop=True)
+        except Exception as e:
+            print(f"[Error] Polling stopped: {e}")
+            time.sleep(5)
+
+def run_scheduler():
+    last_reminder_slot = None
+    last_update_date = None
+    while True:
+        now = datetime.now()
+        current_slot = now.strftime("%Y-%m-%d %H:%M")
+        current_date = now.strftime("%Y-%m-%d")
+        if now.minute % SLOT_MINUTES == 0 and last_reminder_slot != current_slot:
+            last_reminder_slot = current_slot
+            if now.hour == 0 and now.minute == 0 and last_update_date != current_date:
+                last_update_date = current_date
+                try:
+                    db_updater.update_slots()
+                except Exception as e:
+                    print(f"[Error] Slot maintenance failed: {e}")
+            reminder.send_reminders(bot.main_bot)
+        time.sleep(SCHEDULER_INTERVAL)
+
+def main():
+    enable_pool()
+    start_outbound_worker()
+    init_db()
+    start_outbox_dispatcher({"main": bot.main_bot, "admin": bot.admin_bot})
+    start_prerender_worker()
+    threads = [
+        threading.Thread(target=run_polling, args=(bot.main_bot,), name="main-bot", daemon=True),
+        threading.Thread(target=run_polling, args=(admin.admin_bot,), name="admin-bot", daemon=True),
+        threading.Thread(target=run_scheduler, name="scheduler", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+if __name__ == "__main__":
+    main()
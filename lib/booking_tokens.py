@@ -0,0 +1,55 @@
+import secrets
+from lib.repository import get_repository
+from lib.timeslots import slot_index, slot_time
+
+TOKEN_BYTES = 6
+TOKEN_RETENTION = '-60 days'
+
+def load_booking_summary(booking_ids, cursor=None):
+    rows = get_repository().load_slots_by_id(booking_ids, cursor)
+    if not rows:
+        return None
+    first_date, start_time, group_name, created_by = rows[0]
+    last_date, last_time, _, _ = rows[-1]
+    end_time = slot_time(slot_index(last_date, last_time) + 1)
+    return {
+        'ids': list(booking_ids),
+        'created_by': created_by,
+        'date': first_date,
+        'start_time': start_time,
+        'end_time': end_time,
+        'group_name': group_name
+    }
+
+def create_booking_token(booking_ids, summary=None, cursor=None):
+    if summary is None:
+        summary = load_booking_summary(booking_ids, cursor)
+        if summary is None:
+            return None
+    token = secrets.token_urlsafe(TOKEN_BYTES)
+    get_repository().add_booking_token(token, {**summary, 'ids': list(booking_ids)}, cursor)
+    return token
+
+def resolve_booking_token(token):
+    return get_repository().get_booking_token(token)
+
+def claim_booking_token(token):
+    return get_repository().set_booking_token_used(token, True)
+
+def release_booking_token(token):
+    get_repository().set_booking_token_used(token, False)
+
+def resolve_booking_callback(data):
+    parts = data.split(":")
+    if len(parts) == 2:
+        action, token = parts
+        return action, resolve_booking_token(token)
+    action, booking_ids_str, user_id_str = parts
+    booking_ids = list(map(int, booking_ids_str.split(',')))
+    booking = load_booking_summary(booking_ids)
+    if booking:
+        booking['created_by'] = int(user_id_str)
+    return action, booking
+
+def prune_booking_tokens(cursor):
+    cursor.execute("DELETE FROM booking_tokens WHERE created_at < datetime('now', ?)", (TOKEN_RETENTION,))
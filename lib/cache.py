@@ -0,0 +1,50 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from lib.repository import get_repository
+
+class VersionedCache:
+    def __init__(self, max_entries=None):
+        self._values = OrderedDict()
+        self._max_entries = max_entries
+        self._version = None
+        self._seq = None
+        self._lock = threading.Lock()
+
+    def get(self, key, load, dates=None):
+        version = get_repository().get_data_version()
+        with self._lock:
+            if version != self._version:
+                self._invalidate()
+                self._version = version
+            if key in self._values:
+                self._values.move_to_end(key)
+                return self._values[key][0]
+        value = load()
+        with self._lock:
+            if self._version == version:
+                self._values[key] = (value, dates)
+                self._values.move_to_end(key)
+                if self._max_entries is not None and len(self._values) > self._max_entries:
+                    self._values.popitem(last=False)
+        return value
+
+    def _invalidate(self):
+        try:
+            repository = get_repository()
+            if self._seq is None:
+                self._seq = repository.get_last_change_seq()
+                changed_dates = None
+            else:
+                self._seq, changed_dates = repository.get_changed_dates_since(self._seq)
+        except sqlite3.Error:
+            self._seq = None
+            changed_dates = None
+        if changed_dates is None:
+            self._values.clear()
+            return
+        if not changed_dates:
+            return
+        for key, (_, dates) in list(self._values.items()):
+            if dates is None or not changed_dates.isdisjoint(dates):
+                del self._values[key]
@@ -0,0 +1,38 @@
+from lib.db import connect
+
+CHANGES_RETENTION = '-2 days'
+
+def get_last_change_seq(cursor=None):
+    conn = None
+    if cursor is None:
+        conn = connect()
+        cursor = conn.cursor()
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'")
+    row = cursor.fetchone()
+    if conn:
+        conn.close()
+    return row[0] if row else 0
+
+def get_changes_since(seq):
+    conn = connect()
+    cursor = conn.cursor()
+    last_seq = get_last_change_seq(cursor)
+    cursor.execute("SELECT seq, slot_id, date FROM changes WHERE seq > ? ORDER BY seq", (seq,))
+    rows = cursor.fetchall()
+    conn.close()
+    if rows:
+        if rows[0][0] != seq + 1:
+            return max(last_seq, rows[-1][0]), None
+        return max(last_seq, rows[-1][0]), rows
+    if last_seq > seq:
+        return last_seq, None
+    return seq, rows
+
+def get_changed_dates_since(seq):
+    last_seq, rows = get_changes_since(seq)
+    if rows is None:
+        return last_seq, None
+    return last_seq, {date for _, _, date in rows}
+
+def prune_changes(cursor):
+    cursor.execute("DELETE FROM changes WHERE changed_at < datetime('now', ?)", (CHANGES_RETENTION,))
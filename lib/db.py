@@ -0,0 +1,48 @@
+import queue
+import sqlite3
+import threading
+
+DB_PATH = 'db/bookings.db'
+
+_pool = None
+_version_conn = None
+_version_lock = threading.Lock()
+
+class PooledConnection(sqlite3.Connection):
+    pooled = False
+
+    def close(self):
+        if self.pooled:
+            return
+        if _pool is None:
+            super().close()
+            return
+        try:
+            self.rollback()
+            self.pooled = True
+            _pool.put_nowait(self)
+        except (queue.Full, sqlite3.Error):
+            self.pooled = False
+            super().close()
+
+def enable_pool(size=8):
+    global _pool
+    if _pool is None:
+        _pool = queue.Queue(maxsize=size)
+
+def connect():
+    if _pool is not None:
+        try:
+            conn = _pool.get_nowait()
+            conn.pooled = False
+            return conn
+        except queue.Empty:
+            pass
+    return sqlite3.connect(DB_PATH, check_same_thread=False, factory=PooledConnection)
+
+def get_data_version():
+    global _version_conn
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        return _version_conn.execute('PRAGMA data_version').fetchone()[0]
@@ -1,8 +1,36 @@
-import sqlite3
+import logging
 from datetime import datetime, timedelta
+from lib.db import connect
+from lib.rooms import ROOM_IDS, DEFAULT_ROOM
+from lib.timeslots import DAY_TIMES, SLOT_MINUTES, TIME_INDEX
+from lib.stats import init_stats
+from lib.search import init_search
+
+logger = logging.getLogger(__name__)
+
+def remap_split_tokens(cursor, first_new_id, split_minutes):
+    # Unresolved tokens list only the coarse rows; add the sub-slots split off
+    # them so confirming or rejecting the token still covers the whole booking.
+    step = split_minutes // SLOT_MINUTES
+    cursor.execute('SELECT token, slot_ids FROM booking_tokens WHERE used_at IS NULL')
+    for token, slot_ids in cursor.fetchall():
+        ids = list(map(int, slot_ids.split(',')))
+        cursor.execute(f"SELECT room, date, time FROM slots WHERE id IN ({','.join('?' * len(ids))})", ids)
+        for room, date, time in cursor.fetchall():
+            index = TIME_INDEX.get(time)
+            if index is None:
+                continue
+            parts = DAY_TIMES[index + 1:index + step]
+            cursor.execute(
+                f"SELECT id FROM slots WHERE id >= ? AND room = ? AND date = ? AND time IN ({','.join('?' * len(parts))})",
+                (first_new_id, room, date, *parts)
+            )
+            ids.extend(row[0] for row in cursor.fetchall())
+        cursor.execute(f"SELECT id FROM slots WHERE id IN ({','.join('?' * len(ids))}) ORDER BY date, time", ids)
+        cursor.execute('UPDATE booking_tokens SET slot_ids = ? WHERE token = ?', (','.join(str(row[0]) for row in cursor.fetchall()), token))
 
 def init_db():
-    conn = sqlite3.connect('db/bookings.db', check_same_thread=False)
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS slots (
@@ -24,16 +52,121 @@ def init_db():
     add_column_if_not_exists("slots", "comment", "TEXT DEFAULT NULL")
     add_column_if_not_exists("slots", "contact_info", "TEXT DEFAULT NULL")
     add_column_if_not_exists("slots", "status", "INTEGER DEFAULT 0")
-    cursor.execute('SELECT COUNT(*) FROM slots')
-    if cursor.fetchone()[0] == 0:
-        times = [f"{hour:02d}:00" for hour in range(0, 24)]
-        today = datetime.now().date()
+    add_column_if_not_exists("slots", "room", f"INTEGER NOT NULL DEFAULT {DEFAULT_ROOM}")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_slots_room_date_time ON slots (room, date, time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_slots_date_time ON slots (date, time)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            slot_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS booking_tokens (
+            token TEXT PRIMARY KEY,
+            slot_ids TEXT NOT NULL,
+            created_by INTEGER,
+            date TEXT,
+            start_time TEXT,
+            end_time TEXT,
+            group_name TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    add_column_if_not_exists("booking_tokens", "used_at", "TEXT DEFAULT NULL")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_changes_slot_id ON changes (slot_id)')
+    # Subscriber notifications now go through the outbox with the clear.
+    cursor.execute('DROP TABLE IF EXISTS notification_log')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bot TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            options TEXT NOT NULL DEFAULT '{}',
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            claimed_at TEXT,
+            sent_at TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (sent_at, id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS telegram_files (
+            bot TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (bot, variant)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rendered_images (
+            variant TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            image BLOB NOT NULL,
+            rendered_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS slots_changes_insert AFTER INSERT ON slots
+        BEGIN
+            INSERT INTO changes (slot_id, date) VALUES (NEW.id, NEW.date);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS slots_changes_update AFTER UPDATE ON slots
+        BEGIN
+            INSERT INTO changes (slot_id, date) VALUES (NEW.id, NEW.date);
+            INSERT INTO changes (slot_id, date) SELECT OLD.id, OLD.date WHERE OLD.date != NEW.date;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS slots_changes_delete AFTER DELETE ON slots
+        BEGIN
+            INSERT INTO changes (slot_id, date) VALUES (OLD.id, OLD.date);
+        END
+    ''')
+    init_stats(cursor)
+    init_search(cursor)
+    times = DAY_TIMES
+    # user_version holds the slot size existing rows were split to; 0 means the original hour rows.
+    cursor.execute('PRAGMA user_version')
+    split_minutes = cursor.fetchone()[0] or 60
+    if SLOT_MINUTES < split_minutes:
+        cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM slots')
+        first_new_id = cursor.fetchone()[0]
+        for previous, time in zip(DAY_TIMES, DAY_TIMES[1:]):
+            if time.endswith(":00"):
+                continue
+            cursor.execute('''
+                INSERT INTO slots (room, date, time, user_id, group_name, created_by, subscribed_users, booking_type, comment, contact_info, status)
+                SELECT room, date, ?, user_id, group_name, created_by, subscribed_users, booking_type, comment, contact_info, status
+                FROM slots p WHERE p.time = ? AND NOT EXISTS (
+                    SELECT 1 FROM slots s WHERE s.room = p.room AND s.date = p.date AND s.time = ?
+                )
+            ''', (time, previous, time))
+        remap_split_tokens(cursor, first_new_id, split_minutes)
+        cursor.execute(f'PRAGMA user_version = {SLOT_MINUTES}')
+    placeholders = ','.join('?' * len(ROOM_IDS))
+    cursor.execute(f'SELECT DISTINCT room FROM slots WHERE room NOT IN ({placeholders})', ROOM_IDS)
+    unknown_rooms = [row[0] for row in cursor.fetchall()]
+    if unknown_rooms:
+        logger.warning("slots reference room ids %s that are not in ROOMS; check the ids in ROOMS", unknown_rooms)
+    today = datetime.now().date()
+    for room in ROOM_IDS:
+        cursor.execute('SELECT COUNT(*) FROM slots WHERE room = ?', (room,))
+        if cursor.fetchone()[0] > 0:
+            continue
         for i in range(28):
             date = (today + timedelta(days=i)).strftime('%Y-%m-%d')
             for time in times:
                 cursor.execute(
-                    'INSERT INTO slots (date, time, status) VALUES (?, ?, ?)', 
-                    (date, time, 0)
+                    'INSERT INTO slots (date, time, status, room) VALUES (?, ?, ?, ?)',
+                    (date, time, 0, room)
                 )
     conn.commit()
     conn.close()
\ No newline at end of file
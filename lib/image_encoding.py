@@ -0,0 +1,71 @@
+import io
+import logging
+import os
+import time
+from PIL import Image, features
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IMAGE_BYTE_BUDGET = int(os.getenv("IMAGE_BYTE_BUDGET", "200000"))
+IMAGE_FORMATS = [name.strip().upper() for name in os.getenv("IMAGE_FORMATS", "PNG").split(",") if name.strip()]
+PALETTE_COLORS = 64
+JPEG_QUALITIES = (90, 80, 70, 60)
+
+def build_palette(backgrounds, ink=(0, 0, 0), steps=16):
+    colors = []
+    for background in backgrounds:
+        for level in range(steps):
+            color = tuple(round(b + (i - b) * level / (steps - 1)) for b, i in zip(background, ink))
+            if color not in colors:
+                colors.append(color)
+    if len(colors) > 256:
+        raise ValueError(f"Palette needs {len(colors)} colors, at most 256 are supported")
+    palette = Image.new("P", (1, 1))
+    palette.putpalette([channel for color in colors for channel in color])
+    return palette
+
+def to_palette(img, palette):
+    return img.quantize(palette=palette, dither=Image.Dither.NONE)
+
+def encode_image(img, budget=IMAGE_BYTE_BUDGET, formats=IMAGE_FORMATS):
+    started = time.perf_counter()
+    if img.mode not in ("P", "L"):
+        paletted = img.quantize(PALETTE_COLORS, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    else:
+        paletted = img
+    best = None
+    for name in formats:
+        for data in _encode_candidates(name, img, paletted):
+            if best is None or len(data) < len(best[1]):
+                best = (name, data)
+            if len(data) <= budget:
+                break
+        if best and len(best[1]) <= budget:
+            break
+    if best is None:
+        best = ("PNG", _save(paletted, format="PNG", dpi=(300, 300)))
+    name, data = best
+    logger.info(
+        "Encoded %dx%d image as %s: %d bytes in %.0f ms (budget %d)",
+        img.width, img.height, name, len(data), (time.perf_counter() - started) * 1000, budget
+    )
+    return data
+
+def _encode_candidates(name, img, paletted):
+    if name == "PNG":
+        yield _save(paletted, format="PNG", dpi=(300, 300))
+        yield _save(paletted, format="PNG", dpi=(300, 300), optimize=True)
+    elif name == "WEBP" and features.check("webp"):
+        yield _save(paletted.convert("RGB"), format="WEBP", lossless=True)
+    elif name == "JPEG":
+        rgb = img.convert("RGB")
+        for quality in JPEG_QUALITIES:
+            yield _save(rgb, format="JPEG", quality=quality, optimize=True)
+
+def _save(img, **options):
+    buffer = io.BytesIO()
+    img.save(buffer, **options)
+    return buffer.getvalue()
@@ -1,8 +1,94 @@
-import sqlite3
 from telebot import types
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-from lib.utils import get_user_id_from_booking_ids, format_date
-from datetime import datetime
+from lib.utils import format_date
+from lib.booking_tokens import create_booking_token
+import calendar
+from lib.rooms import ROOMS
+from lib.timeslots import SLOTS_PER_HOUR, WEEKDAY_LABELS, MONTH_NAMES, slots_to_hours
+
+def build_reply_keyboard(*rows):
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    for row in rows:
+        markup.row(*[types.KeyboardButton(text) for text in row])
+    return markup.to_json()
+
+MAIN_MENU_KEYBOARD = build_reply_keyboard(
+    ["Посмотреть расписание"],
+    ["Забронировать время"],
+    ["Отменить бронь"],
+    ["Быть в курсе, если освободится время"],
+    ["Посмотреть прайс"]
+)
+SUBSCRIBE_CONTINUE_KEYBOARD = build_reply_keyboard(["Оповестить про другое время", "Вернуться на главную"])
+BOOKING_TYPE_KEYBOARD = build_reply_keyboard(["Репетиция", "Запись", "Другое"])
+COMMENT_PROMPT_KEYBOARD = build_reply_keyboard(["Прайс", "Ок"])
+BOOKING_CONTINUE_KEYBOARD = build_reply_keyboard(["Забронировать другое время"], ["Вернуться на главную"])
+ADMIN_MENU_KEYBOARD = build_reply_keyboard(
+    ["Просмотреть неподтвержденные брони"],
+    ["Посмотреть расписание"],
+    ["Отменить бронь"],
+    ["Поиск броней", "Статистика"]
+)
+SCHEDULE_TYPE_KEYBOARD = build_reply_keyboard(["Расписание на 28 дней", "Расписание на сегодня"])
+SCHEDULE_FORMAT_KEYBOARD = build_reply_keyboard(["Картинкой", "Списком"])
+NOTIFY_CHOICE_KEYBOARD = build_reply_keyboard(["✅ Да", "❌ Нет"])
+SEARCH_KEYBOARD = build_reply_keyboard(["На главную"])
+CALENDAR_KEYBOARD = build_reply_keyboard(["На главную"])
+REMOVE_KEYBOARD = types.ReplyKeyboardRemove().to_json()
+ROOM_SELECTION_KEYBOARD = build_reply_keyboard(*[[name] for name in ROOMS], ["На главную"])
+TIME_KEYBOARD_WIDTH = 3 if SLOTS_PER_HOUR == 1 else 4
+
+def create_page_keyboard(prefix, page, total):
+    if total <= 1:
+        return None
+    keyboard = InlineKeyboardMarkup()
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"{prefix}:{page - 1}"))
+    buttons.append(InlineKeyboardButton(f"{page + 1}/{total}", callback_data=f"{prefix}:-"))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"{prefix}:{page + 1}"))
+    keyboard.row(*buttons)
+    return keyboard
+
+def create_free_days_calendar(room, month, counts, dates):
+    year, month_number = int(month[:4]), int(month[5:7])
+    months = sorted({date[:7] for date in dates})
+    index = months.index(month)
+    keyboard = InlineKeyboardMarkup()
+    previous_button = InlineKeyboardButton("◀️", callback_data=f"cal:{room}:{months[index - 1]}") if index > 0 else InlineKeyboardButton(" ", callback_data="cal:-")
+    next_button = InlineKeyboardButton("▶️", callback_data=f"cal:{room}:{months[index + 1]}") if index < len(months) - 1 else InlineKeyboardButton(" ", callback_data="cal:-")
+    keyboard.row(previous_button, InlineKeyboardButton(f"{MONTH_NAMES[month_number - 1]} {year}", callback_data="cal:-"), next_button)
+    keyboard.row(*[InlineKeyboardButton(label, callback_data="cal:-") for label in WEEKDAY_LABELS])
+    for week in calendar.Calendar().monthdayscalendar(year, month_number):
+        buttons = []
+        for day in week:
+            date = f"{month}-{day:02d}"
+            if not day or date not in dates:
+                buttons.append(InlineKeyboardButton(str(day) if day else " ", callback_data="cal:-"))
+            elif counts.get(date, 0) > 0:
+                hours = str(slots_to_hours(counts[date])).replace(".", ",")
+                buttons.append(InlineKeyboardButton(f"{day}·{hours}", callback_data=f"cal_day:{room}:{date}"))
+            else:
+                buttons.append(InlineKeyboardButton(f"{day}✕", callback_data="cal:full"))
+        keyboard.row(*buttons)
+    return keyboard
+
+def create_bulk_action_keyboard(bookings, selected):
+    keyboard = InlineKeyboardMarkup()
+    for index, booking in enumerate(bookings):
+        mark = "☑️" if index in selected else "⬜"
+        day = f"{booking['date'][8:10]}.{booking['date'][5:7]}"
+        keyboard.row(InlineKeyboardButton(
+            f"{mark} {day} {booking['start_time']}–{booking['end_time']} {booking['group_name']}",
+            callback_data=f"bulk:toggle:{index}"
+        ))
+    keyboard.row(InlineKeyboardButton(f"✅ Подтвердить выбранные ({len(selected)})", callback_data="bulk:confirm_selected"))
+    keyboard.row(
+        InlineKeyboardButton("✅ Подтвердить все", callback_data="bulk:confirm_all"),
+        InlineKeyboardButton("❌ Отклонить все", callback_data="bulk:reject_all")
+    )
+    return keyboard
 
 def send_booking_selection_keyboard(chat_id, bookings, bot):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -24,87 +110,23 @@ def send_date_selection_keyboard(chat_id, dates, bot):
     markup.row(types.KeyboardButton("На главную"))
     bot.send_message(chat_id, "Выберите день для отмены брони:", reply_markup=markup)
 
-def create_confirmation_keyboard(selected_day, selected_time, booking_ids=None):
+def create_confirmation_keyboard(booking_ids, cursor=None):
     keyboard = InlineKeyboardMarkup()
-    if not booking_ids:
-        conn = sqlite3.connect('db/bookings.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT created_by FROM slots WHERE date = ? AND time = ?', (selected_day, selected_time))
-        creator_row = cursor.fetchone()
-        if not creator_row:
-            conn.close()
-            return None
-        creator_id = creator_row[0]
-        cursor.execute('SELECT id, created_by, date, time FROM slots WHERE created_by = ? ORDER BY date, time', (creator_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        if not rows:
-            return None
-        bookings = []
-        for row in rows:
-            bid, user_id, date_str, time_str = row
-            try:
-                dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-            except ValueError:
-                continue
-            bookings.append({'id': bid})
-        grouped = []
-        current_group = None
-        for booking in bookings:
-            if not current_group:
-                current_group = {'ids': [booking['id']]}
-            else:
-                current_group['ids'].append(booking['id'])
-        if current_group:
-            grouped.append(current_group)
-        if not grouped:
-            return None
-        booking_ids = grouped[0]['ids']
-    user_id = get_user_id_from_booking_ids(booking_ids)
+    token = create_booking_token(booking_ids, cursor=cursor)
+    if not token:
+        return None
     keyboard.row(
-        InlineKeyboardButton("✅ Подтвердить", callback_data=f"confirm:{','.join(map(str, booking_ids))}:{user_id}"),
-        InlineKeyboardButton("❌ Отклонить", callback_data=f"reject:{','.join(map(str, booking_ids))}:{user_id}")
+        InlineKeyboardButton("✅ Подтвердить", callback_data=f"confirm:{token}"),
+        InlineKeyboardButton("❌ Отклонить", callback_data=f"reject:{token}")
     )
     return keyboard
 
-def create_cancellation_keyboard(selected_day, selected_time, booking_ids=None):
+def create_cancellation_keyboard(booking_ids):
     keyboard = InlineKeyboardMarkup()
-    if not booking_ids:
-        conn = sqlite3.connect('db/bookings.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT created_by FROM slots WHERE date = ? AND time = ?', (selected_day, selected_time))
-        creator_row = cursor.fetchone()
-        if not creator_row:
-            conn.close()
-            return None
-        creator_id = creator_row[0]
-        cursor.execute('SELECT id, created_by, date, time FROM slots WHERE created_by = ? ORDER BY date, time', (creator_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        if not rows:
-            return None
-        bookings = []
-        for row in rows:
-            bid, user_id, date_str, time_str = row
-            try:
-                dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-            except ValueError:
-                continue
-            bookings.append({'id': bid})
-        grouped = []
-        current_group = None
-        for booking in bookings:
-            if not current_group:
-                current_group = {'ids': [booking['id']]}
-            else:
-                current_group['ids'].append(booking['id'])
-        if current_group:
-            grouped.append(current_group)
-        if not grouped:
-            return None
-        booking_ids = grouped[0]['ids']
-    user_id = get_user_id_from_booking_ids(booking_ids)
+    token = create_booking_token(booking_ids)
+    if not token:
+        return None
     keyboard.row(
-        InlineKeyboardButton("🚫 Подтвердить отмену", callback_data=f"cancel:{','.join(map(str, booking_ids))}:{user_id}")
+        InlineKeyboardButton("🚫 Подтвердить отмену", callback_data=f"cancel:{token}")
     )
     return keyboard
\ No newline at end of file
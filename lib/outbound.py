@@ -0,0 +1,30 @@
+import queue
+import threading
+import time
+
+SEND_INTERVAL = 0.05
+
+_queue = None
+
+def start_outbound_worker():
+    global _queue
+    if _queue is not None:
+        return
+    _queue = queue.Queue()
+    threading.Thread(target=_run_worker, name="outbound", daemon=True).start()
+
+def send_message(bot, chat_id, text, **kwargs):
+    if _queue is None:
+        return bot.send_message(chat_id, text, **kwargs)
+    _queue.put((bot, chat_id, text, kwargs))
+
+def _run_worker():
+    while True:
+        bot, chat_id, text, kwargs = _queue.get()
+        try:
+            bot.send_message(chat_id, text, **kwargs)
+        except Exception as e:
+            print(f"[Error] Can't deliver queued message to {chat_id}: {e}")
+        finally:
+            _queue.task_done()
+        time.sleep(SEND_INTERVAL)
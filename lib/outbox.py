@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+from lib.db import connect
+
+OUTBOX_POLL_INTERVAL = 1.0
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_LEASE = '-60 seconds'
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETENTION = '-7 days'
+SEND_INTERVAL = 0.05
+
+_wakeup = threading.Event()
+
+def enqueue(cursor, bot_name, chat_id, text, **kwargs):
+    if "reply_markup" in kwargs and hasattr(kwargs["reply_markup"], "to_json"):
+        kwargs["reply_markup"] = kwargs["reply_markup"].to_json()
+    cursor.execute(
+        'INSERT INTO outbox (bot, chat_id, text, options) VALUES (?, ?, ?, ?)',
+        (bot_name, chat_id, text, json.dumps(kwargs, ensure_ascii=False))
+    )
+
+def enqueue_all(cursor, notifications):
+    for bot_name, chat_id, text, kwargs in notifications:
+        enqueue(cursor, bot_name, chat_id, text, **kwargs)
+
+def wake_dispatcher():
+    _wakeup.set()
+
+def claim_pending(limit=OUTBOX_BATCH_SIZE):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE outbox SET claimed_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+        WHERE id IN (
+            SELECT id FROM outbox
+            WHERE sent_at IS NULL AND attempts < ?
+              AND (claimed_at IS NULL OR claimed_at < datetime('now', ?))
+            ORDER BY id LIMIT ?
+        )
+        RETURNING id, bot, chat_id, text, options
+    ''', (OUTBOX_MAX_ATTEMPTS, OUTBOX_LEASE, limit))
+    rows = sorted(cursor.fetchall())
+    conn.commit()
+    conn.close()
+    return rows
+
+def dispatch_pending(bots):
+    rows = claim_pending()
+    sent, failed = [], []
+    for outbox_id, bot_name, chat_id, text, options in rows:
+        try:
+            bots[bot_name].send_message(chat_id, text, **json.loads(options))
+            sent.append((outbox_id,))
+        except Exception as e:
+            print(f"[Error] Can't deliver outbox message {outbox_id} to {chat_id}: {e}")
+            failed.append((str(e), outbox_id))
+        time.sleep(SEND_INTERVAL)
+    if sent or failed:
+        conn = connect()
+        conn.executemany('UPDATE outbox SET sent_at = CURRENT_TIMESTAMP WHERE id = ?', sent)
+        conn.executemany('UPDATE outbox SET last_error = ? WHERE id = ?', failed)
+        conn.commit()
+        conn.close()
+    return len(rows)
+
+def start_outbox_dispatcher(bots):
+    threading.Thread(target=_run_dispatcher, args=(bots,), name="outbox", daemon=True).start()
+
+def _run_dispatcher(bots):
+    while True:
+        _wakeup.clear()
+        try:
+            if dispatch_pending(bots) == OUTBOX_BATCH_SIZE:
+                continue
+        except Exception as e:
+            print(f"[Error] Outbox dispatch failed: {e}")
+        _wakeup.wait(OUTBOX_POLL_INTERVAL)
+
+def prune_outbox(cursor):
+    cursor.execute("DELETE FROM outbox WHERE created_at < datetime('now', ?) AND (sent_at IS NOT NULL OR attempts >= ?)", (OUTBOX_RETENTION, OUTBOX_MAX_ATTEMPTS))
@@ -0,0 +1,26 @@
+from lib.db import connect
+from lib.changes import get_last_change_seq
+from lib.telegram_files import get_variant_name
+
+def load_prerendered_image(variant):
+    conn = connect()
+    cursor = conn.cursor()
+    version = get_last_change_seq(cursor)
+    cursor.execute(
+        'SELECT image FROM rendered_images WHERE variant = ? AND version = ?',
+        (get_variant_name(variant), version)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def store_prerendered_image(variant, version, image):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM rendered_images WHERE version < ?', (version,))
+    cursor.execute(
+        'INSERT OR REPLACE INTO rendered_images (variant, version, image) VALUES (?, ?, ?)',
+        (get_variant_name(variant), version, image)
+    )
+    conn.commit()
+    conn.close()
@@ -0,0 +1,82 @@
+import threading
+import time
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
+from telebot.types import CallbackQuery
+
+CHEAP_LIMIT = (20, 1.0)
+EXPENSIVE_LIMIT = (3, 1 / 20)
+BOOKING_LIMIT = (5, 1 / 60)
+IDLE_BUCKET_LIMIT = 10000
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated", "warned")
+
+    def __init__(self, capacity, rate, now):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+        self.warned = False
+
+    def take(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.warned = False
+            return True
+        return False
+
+    def retry_after(self):
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class RateLimiter:
+
+    def __init__(self, limits):
+        self._limits = limits
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, chat_id, kind):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((chat_id, kind))
+            if bucket is None:
+                if len(self._buckets) >= IDLE_BUCKET_LIMIT:
+                    self._prune(now)
+                bucket = self._buckets[(chat_id, kind)] = TokenBucket(*self._limits[kind], now)
+            if bucket.take(now):
+                return True, False, 0.0
+            # Warn only on the first rejection in a row.
+            should_warn = not bucket.warned
+            bucket.warned = True
+            return False, should_warn, bucket.retry_after()
+
+    def _prune(self, now):
+        for key, bucket in list(self._buckets.items()):
+            if bucket.is_full(now):
+                del self._buckets[key]
+
+class ChatRateLimitMiddleware(BaseMiddleware):
+
+    def __init__(self, bot, limiter, warning):
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+        self.bot = bot
+        self.limiter = limiter
+        self.warning = warning
+
+    def pre_process(self, update, data):
+        message = update.message if isinstance(update, CallbackQuery) else update
+        allowed, should_warn, _ = self.limiter.acquire(message.chat.id, "cheap")
+        if allowed:
+            return None
+        if should_warn:
+            self.bot.send_message(message.chat.id, self.warning)
+        return CancelUpdate()
+
+    def post_process(self, update, data, exception):
+        pass
@@ -0,0 +1,547 @@
+import threading
+from abc import ABC, abstractmethod
+from lib.db import connect, get_data_version
+from lib.changes import get_last_change_seq, get_changed_dates_since
+from lib.outbox import enqueue_all
+from lib.rooms import ROOM_IDS
+from lib.timeslots import DAY_TIMES, slot_index
+
+BOOKING_FIELDS = ("user_id", "group_name", "created_by", "booking_type", "comment", "contact_info")
+CLEARED_BOOKING = "user_id = NULL, group_name = NULL, created_by = NULL, booking_type = NULL, comment = NULL, contact_info = NULL, subscribed_users = NULL, status = 0"
+
+def count_range_slots(ranges):
+    return sum(slot_index(slot_date, last_time) - slot_index(slot_date, first_time) + 1 for slot_date, first_time, last_time in ranges)
+
+class SlotRepository(ABC):
+    @abstractmethod
+    def get_data_version(self):
+        ...
+
+    @abstractmethod
+    def get_last_change_seq(self):
+        ...
+
+    @abstractmethod
+    def get_changed_dates_since(self, seq):
+        ...
+
+    @abstractmethod
+    def load_day(self, date):
+        ...
+
+    @abstractmethod
+    def load_room_day(self, room, date):
+        ...
+
+    @abstractmethod
+    def count_free_slots(self, first_date, last_date, from_time, first_day_from):
+        ...
+
+    @abstractmethod
+    def get_booked_dates(self, room, since, from_time):
+        ...
+
+    @abstractmethod
+    def get_subscriptions(self, room, date):
+        ...
+
+    @abstractmethod
+    def add_subscriber(self, room, date, time, user_id):
+        ...
+
+    @abstractmethod
+    def get_dates(self, since, limit):
+        ...
+
+    @abstractmethod
+    def get_user_slots(self, room, user_id, first_date, last_date):
+        ...
+
+    @abstractmethod
+    def load_booking_rows(self, since=None, until=None, dates=None, statuses=(1, 2), created_by=None, extra_fields=()):
+        ...
+
+    @abstractmethod
+    def load_slots_by_id(self, ids, cursor=None):
+        ...
+
+    @abstractmethod
+    def is_range_free(self, room, ranges):
+        ...
+
+    @abstractmethod
+    def book_ranges(self, room, ranges, fields, notify=None):
+        ...
+
+    @abstractmethod
+    def set_status(self, room, date, time, status):
+        ...
+
+    @abstractmethod
+    def confirm(self, ids, notifications=(), created_by=None):
+        ...
+
+    @abstractmethod
+    def clear(self, ids, notifications=(), created_by=None, statuses=(1, 2), notify_subscribers=None):
+        ...
+
+    @abstractmethod
+    def apply_pending(self, bookings, confirm, notify=None):
+        ...
+
+    @abstractmethod
+    def add_booking_token(self, token, booking, cursor=None):
+        ...
+
+    @abstractmethod
+    def get_booking_token(self, token):
+        ...
+
+    @abstractmethod
+    def set_booking_token_used(self, token, used):
+        ...
+
+class SqliteSlotRepository(SlotRepository):
+    def get_data_version(self):
+        return get_data_version()
+
+    def get_last_change_seq(self):
+        return get_last_change_seq()
+
+    def get_changed_dates_since(self, seq):
+        return get_changed_dates_since(seq)
+
+    def _fetchall(self, query, params=()):
+        conn = connect()
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    def _write(self, statements, notifications=()):
+        conn = connect()
+        cursor = conn.cursor()
+        try:
+            for query, params in statements:
+                cursor.execute(query, params)
+            enqueue_all(cursor, notifications)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load_day(self, date):
+        rooms = {}
+        for room, time, status, group_name in self._fetchall("SELECT room, time, status, group_name FROM slots WHERE date = ? ORDER BY room, time", (date,)):
+            rooms.setdefault(room, []).append((time, status, group_name))
+        return rooms
+
+    def load_room_day(self, room, date):
+        return self._fetchall("SELECT time, status, group_name, booking_type, comment FROM slots WHERE room = ? AND date = ? ORDER BY time", (room, date))
+
+    def count_free_slots(self, first_date, last_date, from_time, first_day_from):
+        rows = self._fetchall(
+            "SELECT room, date, COUNT(*) FROM slots WHERE date BETWEEN ? AND ? AND status = 0 AND time >= ? AND (date != ? OR time >= ?) GROUP BY room, date",
+            (first_date, last_date, from_time, first_date, first_day_from)
+        )
+        return {(room, date): count for room, date, count in rows}
+
+    def get_booked_dates(self, room, since, from_time):
+        rows = self._fetchall("SELECT DISTINCT date FROM slots WHERE room = ? AND time >= ? AND status IN (1, 2) AND date >= ?", (room, from_time, since))
+        return [row[0] for row in rows]
+
+    def get_subscriptions(self, room, date):
+        return self._fetchall("SELECT time, subscribed_users FROM slots WHERE room = ? AND date = ? AND status IN (1, 2) ORDER BY time", (room, date))
+
+    def add_subscriber(self, room, date, time, user_id):
+        conn = connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, subscribed_users FROM slots WHERE room = ? AND date = ? AND time = ? AND status IN (1, 2)", (room, date, time))
+        for slot_id, subs in cursor.fetchall():
+            current_subs = set(subs.split(',') if subs else [])
+            if str(user_id) not in current_subs:
+                current_subs.add(str(user_id))
+                cursor.execute("UPDATE slots SET subscribed_users = ? WHERE id = ?", (','.join(current_subs), slot_id))
+        conn.commit()
+        conn.close()
+
+    def get_dates(self, since, limit):
+        return [row[0] for row in self._fetchall("SELECT DISTINCT date FROM slots WHERE date >= ? ORDER BY date LIMIT ?", (since, limit))]
+
+    def get_user_slots(self, room, user_id, first_date, last_date):
+        return self._fetchall(
+            "SELECT date, time FROM slots WHERE room = ? AND created_by = ? AND status > 0 AND date BETWEEN ? AND ? ORDER BY date, time",
+            (room, user_id, first_date, last_date)
+        )
+
+    def load_booking_rows(self, since=None, until=None, dates=None, statuses=(1, 2), created_by=None, extra_fields=()):
+        columns = ", ".join(("id", "room", "date", "time", "group_name", "created_by") + tuple(extra_fields))
+        query = f"SELECT {columns} FROM slots WHERE status IN ({','.join('?' * len(statuses))})"
+        params = list(statuses)
+        if since is not None:
+            query += " AND date >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND date <= ?"
+            params.append(until)
+        if dates is not None:
+            query += f" AND date IN ({','.join('?' * len(dates))})"
+            params.extend(dates)
+        if created_by is not None:
+            query += " AND created_by = ?"
+            params.append(created_by)
+        return self._fetchall(query + " ORDER BY room, date, time", params)
+
+    def load_slots_by_id(self, ids, cursor=None):
+        query = f"SELECT date, time, group_name, created_by FROM slots WHERE id IN ({','.join('?' * len(ids))}) ORDER BY date, time"
+        if cursor is not None:
+            return cursor.execute(query, ids).fetchall()
+        return self._fetchall(query, ids)
+
+    def is_range_free(self, room, ranges):
+        conditions = " OR ".join("(date = ? AND time BETWEEN ? AND ?)" for _ in ranges)
+        params = [room] + [value for slot_range in ranges for value in slot_range]
+        return not self._fetchall(f'SELECT 1 FROM slots WHERE room = ? AND status != 0 AND ({conditions}) LIMIT 1', params)
+
+    def book_ranges(self, room, ranges, fields, notify=None):
+        values = [fields[name] for name in BOOKING_FIELDS]
+        assignments = ", ".join(f"{name} = ?" for name in BOOKING_FIELDS)
+        conn = connect()
+        cursor = conn.cursor()
+        try:
+            booked = []
+            for slot_date, first_time, last_time in ranges:
+                cursor.execute(
+                    f'UPDATE slots SET {assignments}, status = 1 WHERE room = ? AND date = ? AND time BETWEEN ? AND ? AND status = 0 RETURNING date, time, id',
+                    (*values, room, slot_date, first_time, last_time)
+                )
+                booked.extend(cursor.fetchall())
+            if len(booked) != count_range_slots(ranges):
+                conn.rollback()
+                return []
+            booking_ids = [booking_id for _, _, booking_id in sorted(booked)]
+            if notify and booking_ids:
+                enqueue_all(cursor, notify(booking_ids, cursor))
+            conn.commit()
+        finally:
+            conn.close()
+        return booking_ids
+
+    def set_status(self, room, date, time, status):
+        self._write([('UPDATE slots SET status = ? WHERE room = ? AND date = ? AND time = ?', (status, room, date, time))])
+
+    def _update_booking(self, assignment, ids, notifications, created_by, statuses, notify_subscribers=None):
+        # All-or-nothing: a booking that was already resolved (or rebooked by
+        # someone else) must not be changed and must not notify anyone.
+        conditions = f"status IN ({','.join('?' * len(statuses))}) AND id IN ({','.join('?' * len(ids))})"
+        params = [*statuses, *ids]
+        if created_by is not None:
+            conditions += " AND created_by = ?"
+            params.append(created_by)
+        conn = connect()
+        cursor = conn.cursor()
+        try:
+            if notify_subscribers:
+                # The subscribers are read before the clear wipes them, under
+                # the same write lock, so none can be added in between.
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(f"SELECT date, time, subscribed_users FROM slots WHERE {conditions} ORDER BY date, time", params)
+                subscriptions = cursor.fetchall()
+            cursor.execute(f"UPDATE slots SET {assignment} WHERE {conditions}", params)
+            if cursor.rowcount != len(set(ids)):
+                conn.rollback()
+                return False
+            enqueue_all(cursor, notifications)
+            if notify_subscribers:
+                enqueue_all(cursor, notify_subscribers(subscriptions))
+            conn.commit()
+        finally:
+            conn.close()
+        return True
+
+    def confirm(self, ids, notifications=(), created_by=None):
+        return self._update_booking("status = 2", ids, notifications, created_by, (1,))
+
+    def clear(self, ids, notifications=(), created_by=None, statuses=(1, 2), notify_subscribers=None):
+        return self._update_booking(CLEARED_BOOKING, ids, notifications, created_by, statuses, notify_subscribers)
+
+    def apply_pending(self, bookings, confirm, notify=None):
+        assignment = "status = 2" if confirm else CLEARED_BOOKING
+        query = f'UPDATE slots SET {assignment} WHERE status = 1 AND created_by = ? AND id IN ({{}}) RETURNING id'
+        conn = connect()
+        cursor = conn.cursor()
+        applied = []
+        try:
+            for booking in bookings:
+                ids = booking['ids']
+                cursor.execute(query.format(','.join('?' * len(ids))), [booking['created_by'], *ids])
+                if cursor.fetchall():
+                    applied.append(booking)
+            if notify:
+                enqueue_all(cursor, notify(applied))
+            conn.commit()
+        finally:
+            conn.close()
+        return applied
+
+    def add_booking_token(self, token, booking, cursor=None):
+        params = (token, ','.join(map(str, booking['ids'])), booking['created_by'], booking['date'], booking['start_time'], booking['end_time'], booking['group_name'])
+        query = 'INSERT INTO booking_tokens (token, slot_ids, created_by, date, start_time, end_time, group_name) VALUES (?, ?, ?, ?, ?, ?, ?)'
+        if cursor is not None:
+            cursor.execute(query, params)
+        else:
+            self._write([(query, params)])
+
+    def get_booking_token(self, token):
+        rows = self._fetchall('SELECT slot_ids, created_by, date, start_time, end_time, group_name FROM booking_tokens WHERE token = ?', (token,))
+        if not rows:
+            return None
+        slot_ids, created_by, date, start_time, end_time, group_name = rows[0]
+        return {
+            'ids': list(map(int, slot_ids.split(','))),
+            'created_by': created_by,
+            'date': date,
+            'start_time': start_time,
+            'end_time': end_time,
+            'group_name': group_name,
+            'token': token
+        }
+
+    def set_booking_token_used(self, token, used):
+        if used:
+            query = 'UPDATE booking_tokens SET used_at = CURRENT_TIMESTAMP WHERE token = ? AND used_at IS NULL'
+        else:
+            query = 'UPDATE booking_tokens SET used_at = NULL WHERE token = ? AND used_at IS NOT NULL'
+        conn = connect()
+        try:
+            changed = conn.execute(query, (token,)).rowcount == 1
+            conn.commit()
+        finally:
+            conn.close()
+        return changed
+
+class MemorySlotRepository(SlotRepository):
+    def __init__(self):
+        self._slots = {}
+        self._days = {}
+        self._changes = []
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._used_tokens = set()
+        self.outbox = []
+
+    def add_days(self, dates, times=DAY_TIMES, rooms=ROOM_IDS):
+        with self._lock:
+            for date in dates:
+                for room in rooms:
+                    for time in times:
+                        slot_id = len(self._slots) + 1
+                        self._slots[slot_id] = {
+                            "id": slot_id, "room": room, "date": date, "time": time, "status": 0, "subscribed_users": None,
+                            **{name: None for name in BOOKING_FIELDS}
+                        }
+                        self._days.setdefault(date, []).append(slot_id)
+                        self._changes.append(date)
+
+    def _day_slots(self, date):
+        return sorted((self._slots[slot_id] for slot_id in self._days.get(date, ())), key=lambda slot: (slot["room"], slot["time"]))
+
+    def _touch(self, slot):
+        self._changes.append(slot["date"])
+
+    def get_data_version(self):
+        return len(self._changes)
+
+    def get_last_change_seq(self):
+        return len(self._changes)
+
+    def get_changed_dates_since(self, seq):
+        with self._lock:
+            return len(self._changes), set(self._changes[seq:])
+
+    def load_day(self, date):
+        rooms = {}
+        for slot in self._day_slots(date):
+            rooms.setdefault(slot["room"], []).append((slot["time"], slot["status"], slot["group_name"]))
+        return rooms
+
+    def load_room_day(self, room, date):
+        return [
+            (slot["time"], slot["status"], slot["group_name"], slot["booking_type"], slot["comment"])
+            for slot in self._day_slots(date) if slot["room"] == room
+        ]
+
+    def count_free_slots(self, first_date, last_date, from_time, first_day_from):
+        counts = {}
+        for date in self._days:
+            if not first_date <= date <= last_date:
+                continue
+            for slot in self._day_slots(date):
+                if slot["status"] == 0 and slot["time"] >= from_time and (date != first_date or slot["time"] >= first_day_from):
+                    counts[(slot["room"], date)] = counts.get((slot["room"], date), 0) + 1
+        return counts
+
+    def get_booked_dates(self, room, since, from_time):
+        return [
+            date for date in self._days
+            if date >= since and any(slot["room"] == room and slot["status"] in (1, 2) and slot["time"] >= from_time for slot in self._day_slots(date))
+        ]
+
+    def get_subscriptions(self, room, date):
+        return [(slot["time"], slot["subscribed_users"]) for slot in self._day_slots(date) if slot["room"] == room and slot["status"] in (1, 2)]
+
+    def add_subscriber(self, room, date, time, user_id):
+        with self._lock:
+            for slot in self._day_slots(date):
+                if slot["room"] != room or slot["time"] != time or slot["status"] not in (1, 2):
+                    continue
+                current_subs = set(slot["subscribed_users"].split(',') if slot["subscribed_users"] else [])
+                if str(user_id) not in current_subs:
+                    current_subs.add(str(user_id))
+                    slot["subscribed_users"] = ','.join(current_subs)
+                    self._touch(slot)
+
+    def get_dates(self, since, limit):
+        return sorted(date for date in self._days if date >= since)[:limit]
+
+    def get_user_slots(self, room, user_id, first_date, last_date):
+        return sorted(
+            (slot["date"], slot["time"]) for slot in self._slots.values()
+            if slot["room"] == room and slot["created_by"] == user_id and slot["status"] > 0 and first_date <= slot["date"] <= last_date
+        )
+
+    def load_booking_rows(self, since=None, until=None, dates=None, statuses=(1, 2), created_by=None, extra_fields=()):
+        rows = []
+        for slot in self._slots.values():
+            if (
+                slot["status"] not in statuses or
+                (since is not None and slot["date"] < since) or
+                (until is not None and slot["date"] > until) or
+                (dates is not None and slot["date"] not in dates) or
+                (created_by is not None and slot["created_by"] != created_by)
+            ):
+                continue
+            rows.append(tuple(slot[name] for name in ("id", "room", "date", "time", "group_name", "created_by", *extra_fields)))
+        return sorted(rows, key=lambda row: (row[1], row[2], row[3]))
+
+    def load_slots_by_id(self, ids, cursor=None):
+        return sorted(
+            (slot["date"], slot["time"], slot["group_name"], slot["created_by"])
+            for slot in (self._slots.get(slot_id) for slot_id in ids) if slot
+        )
+
+    def _range_slots(self, room, ranges):
+        return [
+            slot
+            for slot_date, first_time, last_time in ranges
+            for slot in self._day_slots(slot_date)
+            if slot["room"] == room and first_time <= slot["time"] <= last_time
+        ]
+
+    def is_range_free(self, room, ranges):
+        return all(slot["status"] == 0 for slot in self._range_slots(room, ranges))
+
+    def book_ranges(self, room, ranges, fields, notify=None):
+        with self._lock:
+            slots = sorted(self._range_slots(room, ranges), key=lambda slot: (slot["date"], slot["time"]))
+            if len(slots) != count_range_slots(ranges) or any(slot["status"] != 0 for slot in slots):
+                return []
+            for slot in slots:
+                slot.update({name: fields[name] for name in BOOKING_FIELDS}, status=1)
+                self._touch(slot)
+            booking_ids = [slot["id"] for slot in slots]
+        if notify and booking_ids:
+            self.outbox.extend(notify(booking_ids, None))
+        return booking_ids
+
+    def set_status(self, room, date, time, status):
+        with self._lock:
+            for slot in self._day_slots(date):
+                if slot["room"] == room and slot["time"] == time:
+                    slot["status"] = status
+                    self._touch(slot)
+
+    def _booking_slots(self, ids, created_by, statuses):
+        slots = [self._slots.get(slot_id) for slot_id in set(ids)]
+        if all(
+            slot and slot["status"] in statuses and (created_by is None or slot["created_by"] == created_by)
+            for slot in slots
+        ):
+            return slots
+        return None
+
+    def confirm(self, ids, notifications=(), created_by=None):
+        with self._lock:
+            slots = self._booking_slots(ids, created_by, (1,))
+            if slots is None:
+                return False
+            for slot in slots:
+                slot["status"] = 2
+                self._touch(slot)
+        self.outbox.extend(notifications)
+        return True
+
+    def _clear_slot(self, slot):
+        slot.update({name: None for name in BOOKING_FIELDS}, subscribed_users=None, status=0)
+        self._touch(slot)
+
+    def clear(self, ids, notifications=(), created_by=None, statuses=(1, 2), notify_subscribers=None):
+        with self._lock:
+            slots = self._booking_slots(ids, created_by, statuses)
+            if slots is None:
+                return False
+            subscriptions = sorted((slot["date"], slot["time"], slot["subscribed_users"]) for slot in slots)
+            for slot in slots:
+                self._clear_slot(slot)
+            self.outbox.extend(notifications)
+            if notify_subscribers:
+                self.outbox.extend(notify_subscribers(subscriptions))
+        return True
+
+    def apply_pending(self, bookings, confirm, notify=None):
+        applied = []
+        with self._lock:
+            for booking in bookings:
+                slots = [
+                    self._slots[slot_id] for slot_id in booking['ids']
+                    if slot_id in self._slots and self._slots[slot_id]["status"] == 1 and self._slots[slot_id]["created_by"] == booking['created_by']
+                ]
+                for slot in slots:
+                    if confirm:
+                        slot["status"] = 2
+                        self._touch(slot)
+                    else:
+                        self._clear_slot(slot)
+                if slots:
+                    applied.append(booking)
+        if notify:
+            self.outbox.extend(notify(applied))
+        return applied
+
+    def add_booking_token(self, token, booking, cursor=None):
+        with self._lock:
+            self._tokens[token] = {key: booking[key] for key in ('ids', 'created_by', 'date', 'start_time', 'end_time', 'group_name')}
+
+    def get_booking_token(self, token):
+        with self._lock:
+            if token not in self._tokens:
+                return None
+            return {**self._tokens[token], 'ids': list(self._tokens[token]['ids']), 'token': token}
+
+    def set_booking_token_used(self, token, used):
+        with self._lock:
+            if token not in self._tokens or (token in self._used_tokens) == used:
+                return False
+            if used:
+                self._used_tokens.add(token)
+            else:
+                self._used_tokens.discard(token)
+            return True
+
+_repository = SqliteSlotRepository()
+
+def get_repository():
+    return _repository
+
+def set_repository(repository):
+    global _repository
+    _repository = repository
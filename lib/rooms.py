@@ -0,0 +1,41 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def parse_rooms(value):
+    rooms = {}
+    entries = [entry.strip() for entry in value.split(",") if entry.strip()]
+    for position, entry in enumerate(entries, start=1):
+        room_id, separator, name = entry.partition(":")
+        if separator and room_id.strip().isdigit():
+            room, name = int(room_id), name.strip()
+        else:
+            # Plain names (the pre-id format) keep their positional ids.
+            room, name = position, entry
+        if room in rooms:
+            raise ValueError(f"ROOMS has duplicate room id {room}")
+        rooms[room] = name
+    return rooms
+
+ROOM_NAMES = parse_rooms(os.getenv("ROOMS") or "Основной зал")
+ROOMS = list(ROOM_NAMES.values())
+ROOM_IDS = list(ROOM_NAMES)
+DEFAULT_ROOM = ROOM_IDS[0]
+
+def has_multiple_rooms():
+    return len(ROOMS) > 1
+
+def get_room_name(room):
+    return ROOM_NAMES.get(room, f"Зал {room}")
+
+def get_room_by_name(name):
+    for room, room_name in ROOM_NAMES.items():
+        if room_name == name:
+            return room
+    return None
+
+def get_room_caption(room):
+    if not has_multiple_rooms():
+        return ""
+    return f" ({get_room_name(room)})"
@@ -0,0 +1,49 @@
+class MessageRouter:
+
+    def __init__(self, get_step):
+        self._get_step = get_step
+        self._by_text = {}
+        self._by_step = {}
+        self._by_step_text = {}
+        self._count = 0
+
+    def _add(self, table, key, handler):
+        if key not in table:
+            table[key] = (self._count, handler)
+        self._count += 1
+        return handler
+
+    def text(self, text):
+        return lambda handler: self._add(self._by_text, text, handler)
+
+    def step(self, step, text=None):
+        if text is None:
+            return lambda handler: self._add(self._by_step, step, handler)
+        return lambda handler: self._add(self._by_step_text, (step, text), handler)
+
+    def routes(self):
+        tables = (("text", self._by_text), ("step", self._by_step), ("step_text", self._by_step_text))
+        entries = [(index, kind, key, handler) for kind, table in tables for key, (index, handler) in table.items()]
+        return [entry[1:] for entry in sorted(entries, key=lambda entry: entry[0])]
+
+    def resolve(self, message):
+        step = self._get_step(message.chat.id)
+        # Like telebot, the earliest registered of the matching routes wins.
+        best = self._by_text.get(message.text)
+        for match in (self._by_step.get(step), self._by_step_text.get((step, message.text))):
+            if match and (best is None or match[0] < best[0]):
+                best = match
+        return best[1] if best else None
+
+    def dispatch(self, message):
+        handler = self.resolve(message)
+        if handler is None:
+            return False
+        handler(message)
+        return True
+
+def get_state_step(user_states, chat_id):
+    state = user_states.get(chat_id)
+    if isinstance(state, dict):
+        return state.get("step")
+    return state
@@ -1,113 +1,231 @@
-import sqlite3
+import time
+import threading
+from functools import lru_cache
 from datetime import datetime
 from PIL import Image, ImageDraw, ImageFont
+from lib.repository import get_repository
+from lib.cache import VersionedCache
+from lib.image_encoding import build_palette, to_palette, encode_image
 from lib.utils import is_admin, format_date
-from lib.schedule_tasks import get_schedule_for_day, get_grouped_daily_bookings, prepare_daily_schedule_data, get_daily_schedule_from_db
+from lib.rooms import ROOM_IDS, DEFAULT_ROOM
+from lib.prerendered_images import load_prerendered_image, store_prerendered_image
+from lib.timeslots import SLOT_MINUTES, shift_date
+from lib.schedule_tasks import get_day_slots, get_grouped_daily_bookings, prepare_daily_schedule_data, get_daily_schedule_from_db
 
-def create_schedule_grid_image(requester_id=None, days_to_show=28):
+# Personalized overlays add one entry per user, so the least recently used images are evicted.
+RENDER_CACHE_ENTRIES = 64
+render_cache = VersionedCache(max_entries=RENDER_CACHE_ENTRIES)
+PRERENDER_INTERVAL = 20
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+BOLD_FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+GRID_CELL_WIDTH, GRID_CELL_HEIGHT, GRID_PADDING = 450, 70, 10
+OWN_BOOKING_COLOR = (170, 200, 255)
+GRID_PALETTE = build_palette([
+    (255, 255, 255), (220, 220, 220), (200, 255, 200), (255, 200, 150), (255, 180, 180), OWN_BOOKING_COLOR
+])
+
+def save_image(img):
+    return encode_image(img)
+
+def get_schedule_grid_variant(requester_id=None, days_to_show=28, room=DEFAULT_ROOM):
     today = datetime.now().strftime("%Y-%m-%d")
-    conn = sqlite3.connect('db/bookings.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT DISTINCT date FROM slots WHERE date >= ? ORDER BY date LIMIT ?',
-        (today, days_to_show)
-    )
-    dates = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    if not dates:
+    if is_admin(requester_id):
+        return ("grid", True, days_to_show, today, room)
+    if requester_id is not None and has_user_grid_slots(requester_id, today, days_to_show, room):
+        return ("grid_user", requester_id, days_to_show, today, room)
+    return ("grid", False, days_to_show, today, room)
+
+def create_schedule_grid_image(requester_id=None, days_to_show=28, room=DEFAULT_ROOM):
+    key = get_schedule_grid_variant(requester_id, days_to_show, room)
+    today = key[3]
+    if key[0] == "grid":
+        return render_cache.get(
+            key,
+            lambda: load_prerendered_image(key) or render_schedule_grid_image(requester_id, days_to_show, today, room)
+        )
+    base = get_grid_base(days_to_show, today, room)
+    if base[0] is None:
         return None
-    schedules = {
-        date: [
-            (t, s, g) for t, s, g in get_schedule_for_day(date, requester_id)
-            if "11:00" <= t <= "23:00"
-        ]
-        for date in dates
-    }
+    return render_cache.get(key, lambda: render_user_overlay(base, get_user_grid_slots(requester_id, base[1], room)))
+
+def get_grid_base(days_to_show, today, room=DEFAULT_ROOM):
+    return render_cache.get(("grid_base", days_to_show, today, room), lambda: layout_schedule_grid(False, days_to_show, today, room))
+
+def render_schedule_grid_image(requester_id, days_to_show, today, room=DEFAULT_ROOM):
+    if is_admin(requester_id):
+        img, _ = layout_schedule_grid(True, days_to_show, today, room)
+    else:
+        img, _ = get_grid_base(days_to_show, today, room)
+    return save_image(img) if img else None
+
+def prerender_schedule_images(days_to_show=28):
+    version = get_repository().get_last_change_seq()
+    today = datetime.now().strftime("%Y-%m-%d")
+    for room in ROOM_IDS:
+        for admin_view in (False, True):
+            img, _ = layout_schedule_grid(True, days_to_show, today, room) if admin_view else get_grid_base(days_to_show, today, room)
+            if img:
+                store_prerendered_image(("grid", admin_view, days_to_show, today, room), version, save_image(img))
+        image = render_daily_schedule_image(today, room)
+        if image:
+            store_prerendered_image(get_daily_schedule_variant(room), version, image)
+
+def start_prerender_worker(interval=PRERENDER_INTERVAL):
+    threading.Thread(target=_run_prerender_worker, args=(interval,), name="prerender", daemon=True).start()
+
+def _run_prerender_worker(interval):
+    # Re-renders once any process's write advances the change feed (or the day
+    # rolls over), so views keep hitting fresh pre-rendered images.
+    last_state = None
+    while True:
+        state = (datetime.now().strftime("%Y-%m-%d"), get_repository().get_last_change_seq())
+        if state != last_state:
+            last_state = state
+            try:
+                prerender_schedule_images()
+            except Exception as e:
+                print(f"[Error] Schedule pre-render failed: {e}")
+        time.sleep(interval)
+
+def layout_schedule_grid(admin_view, days_to_show, today, room=DEFAULT_ROOM):
+    dates = get_repository().get_dates(today, days_to_show)
+    if not dates:
+        return None, {}
+    schedules = {}
+    for date in dates:
+        hours = {}
+        for t, s, g in get_day_slots(date, room):
+            if "11" <= t[:2] <= "23":
+                hours.setdefault(t[:3] + "00", []).append((s, g))
+        schedules[date] = list(hours.items())
     max_slots = max(len(slots) for slots in schedules.values()) if schedules else 1
-    cell_width, cell_height, padding = 450, 70, 10
-    try:
-        font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-        bold_font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
-        time_font = ImageFont.truetype(bold_font_path, 26)
-        group_font = ImageFont.truetype(font_path, 24)
-        date_font = ImageFont.truetype(bold_font_path, 32)
-    except OSError:
-        time_font = group_font = date_font = ImageFont.load_default()
+    cell_width, cell_height, padding = GRID_CELL_WIDTH, GRID_CELL_HEIGHT, GRID_PADDING
     cols = 7
     rows = (len(dates) + cols - 1) // cols
     img_width = cols * (cell_width + padding) + padding
     img_height = rows * ((max_slots + 1) * (cell_height + padding)) + padding
-    img = Image.new("RGB", (img_width, img_height), color="white")
-    draw = ImageDraw.Draw(img)
+    img = Image.new("P", (img_width, img_height), color=0)
+    img.putpalette(GRID_PALETTE.getpalette())
+    cells = {}
     for row_offset in range(rows):
         for col in range(cols):
             index = row_offset * cols + col
             if index >= len(dates):
                 break
-            date = dates[index]
             x = padding + col * (cell_width + padding)
             y = padding + row_offset * ((max_slots + 1) * (cell_height + padding))
-            draw.rectangle([x, y, x + cell_width, y + cell_height], fill=(220, 220, 220))
-            formatted_date = format_date(date)
-            bbox = draw.textbbox((0, 0), formatted_date, font=date_font)
-            tx = x + (cell_width - bbox[2]) // 2
-            ty = y + (cell_height - bbox[3]) // 2
-            draw.text((tx, ty), formatted_date, fill="black", font=date_font)
-    for row_offset in range(rows):
-        for row_index in range(max_slots):
-            for col in range(cols):
-                index = row_offset * cols + col
-                if index >= len(dates):
-                    break
-                date = dates[index]
-                x = padding + col * (cell_width + padding)
-                y = padding + row_offset * ((max_slots + 1) * (cell_height + padding)) + (row_index + 1) * (cell_height + padding)
+            img.paste(get_grid_header_tile(format_date(dates[index])), (x, y))
+            for row_index in range(max_slots):
                 try:
-                    time, status, group_name = schedules[date][row_index]
+                    time, units = schedules[dates[index]][row_index]
                 except IndexError:
-                    time, status, group_name = "", 0, ""
-                if status > 0:
-                    if is_admin(requester_id):
-                        cursor = sqlite3.connect('db/bookings.db').cursor()
-                        cursor.execute('SELECT status FROM slots WHERE date = ? AND time = ?', (date, time))
-                        status = cursor.fetchone()[0]
-                        cursor.close()
-                        if status == 2:
-                            bg_color = (255, 180, 180)
-                        elif status == 1:
-                            bg_color = (255, 200, 150)
-                        else:
-                            bg_color = (255, 200, 200)
-                    else:
-                        bg_color = (255, 180, 180)
-                else:
-                    bg_color = (200, 255, 200)
-                draw.rectangle([x, y, x + cell_width, y + cell_height], fill=bg_color, outline="black")
-                draw.text((x + padding, y + (cell_height - 26) // 2), time, fill="black", font=time_font)
-                if status > 0:
-                    label = group_name if is_admin(requester_id) else "Занято"
-                    fitted_font = group_font
-                    while True:
-                        line_width = draw.textbbox((0, 0), label, font=fitted_font)[2]
-                        if line_width <= cell_width * 0.6 or fitted_font.size <= 28:
-                            break
-                        fitted_font = ImageFont.truetype(font_path, fitted_font.size - 1)
-                    draw.text(
-                        (x + cell_width // 4 + padding, y + (cell_height - fitted_font.size) // 2),
-                        label,
-                        fill="black",
-                        font=fitted_font
-                    )
-    path = "schedule_grid.png"
-    img.save(path, dpi=(300, 300))
-    return path
-
-def create_daily_schedule_image(requester_id=None):
-    from PIL import Image, ImageDraw, ImageFont
-    from lib.schedule_tasks import get_daily_schedule_from_db
-    from datetime import datetime
-    today = datetime.now().strftime("%Y-%m-%d")
-    raw_slots = get_daily_schedule_from_db(today)
+                    time, units = "", [(0, "")]
+                y_cell = y + (row_index + 1) * (cell_height + padding)
+                img.paste(get_grid_cell_tile(*get_grid_cell_spec(time, units, admin_view)), (x, y_cell))
+                if time:
+                    cells[(dates[index], time)] = (x, y_cell, time, units)
+    return img, cells
+
+def get_grid_cell_spec(time, units, admin_view, own_units=()):
+    statuses = tuple(s for s, _ in units)
+    colors = tuple(
+        OWN_BOOKING_COLOR if k in own_units else get_grid_color(s, admin_view)
+        for k, s in enumerate(statuses)
+    )
+    if len(set(colors)) == 1:
+        colors = colors[:1]
+    label = ""
+    if own_units:
+        label = "Ваша бронь"
+    elif max(statuses) > 0:
+        label = next(g for s, g in units if s > 0) if admin_view else "Занято"
+    return time, colors, label or ""
+
+def get_user_grid_slots(user_id, cells, room=DEFAULT_ROOM):
+    if not cells:
+        return {}
+    dates = sorted({date for date, _ in cells})
+    own_slots = {}
+    for date, time in get_repository().get_user_slots(room, user_id, dates[0], dates[-1]):
+        key = (date, time[:3] + "00")
+        if key in cells:
+            own_slots.setdefault(key, set()).add(int(time[3:]) // SLOT_MINUTES)
+    return own_slots
+
+def has_user_grid_slots(user_id, today, days_to_show, room=DEFAULT_ROOM):
+    slots = get_repository().get_user_slots(room, user_id, today, shift_date(today, days_to_show - 1))
+    return any(time >= "11:00" for _, time in slots)
+
+def render_user_overlay(base, own_slots):
+    img, cells = base
+    img = img.copy()
+    for key, own_units in own_slots.items():
+        x, y, time, units = cells[key]
+        img.paste(get_grid_cell_tile(*get_grid_cell_spec(time, units, False, frozenset(own_units))), (x, y))
+    return save_image(img)
+
+@lru_cache(maxsize=None)
+def load_grid_fonts():
+    try:
+        time_font = ImageFont.truetype(BOLD_FONT_PATH, 26)
+        group_font = ImageFont.truetype(FONT_PATH, 24)
+        date_font = ImageFont.truetype(BOLD_FONT_PATH, 32)
+    except OSError:
+        time_font = group_font = date_font = ImageFont.load_default()
+    return time_font, group_font, date_font
+
+@lru_cache(maxsize=256)
+def get_grid_header_tile(formatted_date):
+    _, _, date_font = load_grid_fonts()
+    tile = Image.new("RGB", (GRID_CELL_WIDTH + 1, GRID_CELL_HEIGHT + 1), color=(220, 220, 220))
+    draw = ImageDraw.Draw(tile)
+    bbox = draw.textbbox((0, 0), formatted_date, font=date_font)
+    tx = (GRID_CELL_WIDTH - bbox[2]) // 2
+    ty = (GRID_CELL_HEIGHT - bbox[3]) // 2
+    draw.text((tx, ty), formatted_date, fill="black", font=date_font)
+    return to_palette(tile, GRID_PALETTE)
+
+@lru_cache(maxsize=4096)
+def get_grid_cell_tile(time, colors, label):
+    time_font, group_font, _ = load_grid_fonts()
+    tile = Image.new("RGB", (GRID_CELL_WIDTH + 1, GRID_CELL_HEIGHT + 1), color=colors[0])
+    draw = ImageDraw.Draw(tile)
+    band_height = GRID_CELL_HEIGHT / len(colors)
+    for k, color in enumerate(colors[1:], start=1):
+        tile.paste(color, (0, round(k * band_height), GRID_CELL_WIDTH + 1, round((k + 1) * band_height) + 1))
+    draw.rectangle([0, 0, GRID_CELL_WIDTH, GRID_CELL_HEIGHT], outline="black")
+    draw.text((GRID_PADDING, (GRID_CELL_HEIGHT - 26) // 2), time, fill="black", font=time_font)
+    if label:
+        draw.text(
+            (GRID_CELL_WIDTH // 4 + GRID_PADDING, (GRID_CELL_HEIGHT - group_font.size) // 2),
+            label,
+            fill="black",
+            font=group_font
+        )
+    return to_palette(tile, GRID_PALETTE)
+
+def get_grid_color(status, admin_view):
+    if status == 0:
+        return (200, 255, 200)
+    if admin_view and status == 1:
+        return (255, 200, 150)
+    return (255, 180, 180)
+
+def get_daily_schedule_variant(room=DEFAULT_ROOM):
+    return ("daily", datetime.now().strftime("%Y-%m-%d"), room)
+
+def create_daily_schedule_image(requester_id=None, room=DEFAULT_ROOM):
+    key = get_daily_schedule_variant(room)
+    today = key[1]
+    return render_cache.get(key, lambda: load_prerendered_image(key) or render_daily_schedule_image(today, room), dates=(today,))
+
+def render_daily_schedule_image(today, room=DEFAULT_ROOM):
+    day_slots = get_daily_schedule_from_db(today, room)
+    raw_slots = [
+        slot for i, slot in enumerate(day_slots)
+        if not (i and slot["status"] == 0 and day_slots[i - 1]["status"] == 0 and slot["time"][:2] == day_slots[i - 1]["time"][:2])
+    ]
     if not raw_slots:
         return None
     cell_padding = 10
@@ -208,9 +326,7 @@ def create_daily_schedule_image(requester_id=None):
             for k in range(row_index + 1, row_index + rowspan):
                 drawn.add(k)
             x += column_widths[j + 1] + cell_padding
-    path = "daily_schedule.png"
-    img.save(path, dpi=(300, 300))
-    return path
+    return save_image(img)
 
 def draw_text_centered(draw, text, x, y, w, h, font):
     bbox = draw.textbbox((0, 0), text, font=font)
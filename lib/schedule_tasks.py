@@ -1,77 +1,73 @@
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 from lib.utils import is_admin
+from lib.repository import get_repository
+from lib.cache import VersionedCache
+from lib.outbox import wake_dispatcher
+from lib.rooms import ROOM_IDS, DEFAULT_ROOM
+from lib.timeslots import shift_date, slot_index, slot_index_datetime
 
-def get_booked_days_filtered():
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
+BOOKING_DAYS = 28
+
+schedule_cache = VersionedCache()
+
+def get_booked_days_filtered(room=DEFAULT_ROOM):
     current_date = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("SELECT DISTINCT date FROM slots WHERE time >= '11:00' AND status IN (1, 2)  AND date >= ?", (current_date,))
-    days = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return days
+    return get_repository().get_booked_dates(room, current_date, "11:00")
+
+def get_slot_subscriptions(date, room=DEFAULT_ROOM):
+    return get_repository().get_subscriptions(room, date)
+
+def add_subscriber_to_slot(date, time, user_id, room=DEFAULT_ROOM):
+    get_repository().add_subscriber(room, date, time, user_id)
 
-def add_subscriber_to_slot(date, time, user_id):
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT subscribed_users FROM slots WHERE date = ? AND time = ?", (date, time))
-    result = cursor.fetchone()
-    current_subs = set(result[0].split(',') if result[0] else [])
-    if str(user_id) not in current_subs:
-        current_subs.add(str(user_id))
-        updated_subs = ','.join(current_subs)
-        cursor.execute("UPDATE slots SET subscribed_users = ? WHERE date = ? AND time = ?", (updated_subs, date, time))
-        conn.commit()
-    conn.close()
+def clear_booking_slots(slot_ids, notifications=(), created_by=None, notify_subscribers=None):
+    applied = get_repository().clear(slot_ids, notifications, created_by, notify_subscribers=notify_subscribers)
+    if applied:
+        wake_dispatcher()
+    return applied
 
-def clear_booking_slots(slot_ids, bot):
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    update_query = "UPDATE slots SET user_id = NULL, group_name = NULL, created_by = NULL, booking_type = NULL, comment = NULL, contact_info = NULL, status = 0, subscribed_users = NULL WHERE id IN ({})".format(','.join('?' * len(slot_ids)))
-    cursor.execute(update_query, slot_ids)
-    conn.commit()
-    conn.close()
+def load_schedule_for_day(date):
+    return get_repository().load_day(date)
 
-def get_schedule_for_day(date, user_id=None):
-    conn = sqlite3.connect('db/bookings.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute("SELECT time, status, group_name FROM slots WHERE date = ? ORDER BY time", (date,))
+def get_day_slots(date, room=DEFAULT_ROOM):
+    rooms = schedule_cache.get(("day", date), lambda: load_schedule_for_day(date), dates=(date,))
+    return rooms.get(room, [])
+
+def get_schedule_for_day(date, user_id=None, room=DEFAULT_ROOM):
+    rows = get_day_slots(date, room)
     schedule = []
-    for row in cursor.fetchall():
-        time, status, group_name = row
+    for time, status, group_name in rows:
         if status > 0 and not is_admin(user_id):
             schedule.append((time, True, "Занято"))
         else:
             schedule.append((time, status > 0, group_name))
-    conn.close()
     return schedule
 
-def get_free_days():
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    today = datetime.now().date()
-    now_time = datetime.now()
-    date_list = [(today + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(28)]
-    free_days = []
-    for date_str in date_list:
-        is_today = date_str == today.strftime("%Y-%m-%d")
-        if is_today:
-            current_hour = now_time.hour
-            cursor.execute("SELECT COUNT(*) FROM slots WHERE date = ? AND status != 0 AND time >= ?", (date_str, f"{current_hour:02d}:00"))
-        else:
-            cursor.execute("SELECT COUNT(*) FROM slots WHERE date = ? AND status != 0", (date_str,))
-        result = cursor.fetchone()
-        if result[0] == 0 or result[0] < 13:
-            free_days.append(date_str)
-    conn.close()
-    return free_days
+def get_free_slot_counts(room=DEFAULT_ROOM):
+    now = datetime.now()
+    date_list = get_booking_dates(now)
+    key = ("free_counts", date_list[0], now.hour)
+    counts = schedule_cache.get(key, lambda: load_free_slot_counts(date_list, now.hour), dates=date_list)
+    return counts.get(room, {})
+
+def get_booking_dates(now=None):
+    today = (now or datetime.now()).strftime("%Y-%m-%d")
+    return tuple(shift_date(today, offset) for offset in range(BOOKING_DAYS))
 
-def get_daily_schedule_from_db(date):
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT time, status, group_name, booking_type, comment FROM slots WHERE date = ? ORDER BY time", (date,))
-    rows = cursor.fetchall()
-    conn.close()
+def load_free_slot_counts(date_list, current_hour):
+    # Today only counts the hours the time picker still offers.
+    free_counts = get_repository().count_free_slots(date_list[0], date_list[-1], "11:00", f"{current_hour + 1:02d}:00")
+    counts = {room: {} for room in ROOM_IDS}
+    for (room, date), count in free_counts.items():
+        counts.setdefault(room, {})[date] = count
+    return counts
+
+def get_free_days(room=DEFAULT_ROOM):
+    counts = get_free_slot_counts(room)
+    return [date for date in get_booking_dates() if counts.get(date, 0) > 0]
+
+def get_daily_schedule_from_db(date, room=DEFAULT_ROOM):
+    rows = get_repository().load_room_day(room, date)
     schedule = []
     for row in rows:
         time, status, group_name, booking_type, comment = row
@@ -84,8 +80,8 @@ def get_daily_schedule_from_db(date):
         })
     return schedule
 
-def prepare_daily_schedule_data(date):
-    raw_slots = get_daily_schedule_from_db(date)
+def prepare_daily_schedule_data(date, room=DEFAULT_ROOM):
+    raw_slots = get_daily_schedule_from_db(date, room)
     grouped_slots = []
     current_group = None
     for slot in raw_slots:
@@ -125,189 +121,62 @@ def prepare_daily_schedule_data(date):
         final_schedule.append(slot)
     return final_schedule
 
-def get_grouped_daily_bookings(date):
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    prev_day = (datetime.strptime(date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-    next_day = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-    query = "SELECT id, date, time, group_name, created_by, booking_type, comment FROM slots WHERE date IN (?, ?, ?) AND status IN (1, 2) ORDER BY date, time"
-    params = [prev_day, date, next_day]
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
-    bookings = []
-    for row in rows:
-        bid, date_str, time_str, group_name, user_id, booking_type, comment = row
-        try:
-            dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-        except ValueError:
-            continue
-        bookings.append({
-            'id': bid,
-            'datetime': dt,
-            'date_str': date_str,
-            'time_str': time_str,
-            'group_name': group_name,
-            'user_id': user_id,
-            'booking_type': booking_type,
-            'comment': comment
-        })
+def group_booking_rows(rows, extra_fields=()):
     grouped = []
     current_group = None
-    for booking in bookings:
-        if not current_group:
-            current_group = {
-                'start_time': booking['datetime'],
-                'end_time': booking['datetime'] + timedelta(hours=1),
-                'ids': [booking['id']],
-                'group_name': booking['group_name'],
-                'user_id': booking['user_id'],
-                'booking_type': booking['booking_type'],
-                'comment': booking['comment'],
-                'date_str': booking['date_str']
-            }
-        else:
-            if (
-                booking['group_name'] == current_group['group_name'] and
-                booking['user_id'] == current_group['user_id'] and
-                booking['datetime'] == current_group['end_time']
-            ):
-                current_group['end_time'] += timedelta(hours=1)
-                current_group['ids'].append(booking['id'])
-            else:
-                grouped.append(current_group)
-                current_group = {
-                    'start_time': booking['datetime'],
-                    'end_time': booking['datetime'] + timedelta(hours=1),
-                    'ids': [booking['id']],
-                    'group_name': booking['group_name'],
-                    'user_id': booking['user_id'],
-                    'booking_type': booking['booking_type'],
-                    'comment': booking['comment'],
-                    'date_str': booking['date_str']
-                }
-    if current_group:
-        grouped.append(current_group)
-    filtered_grouped = [
-        g for g in grouped
-        if g['start_time'].strftime("%Y-%m-%d") == date
-    ]
-    return filtered_grouped
-
-def get_grouped_unconfirmed_bookings():
-    with sqlite3.connect('db/bookings.db') as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, date, time, group_name, created_by FROM slots WHERE status = 1 ORDER BY date, time")
-        rows = cursor.fetchall()
-    bookings = []
-    for row in rows:
-        bid, date_str, time_str, group_name, user_id = row
-        try:
-            dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-        except ValueError:
+    last_index = None
+    for bid, room, date_str, time_str, group_name, user_id, *extra in rows:
+        index = slot_index(date_str, time_str)
+        if index is None:
+            continue
+        if (
+            current_group and
+            index == last_index + 1 and
+            room == current_group['room'] and
+            group_name == current_group['group_name'] and
+            user_id == current_group['user_id']
+        ):
+            current_group['ids'].append(bid)
+            last_index = index
             continue
-        bookings.append({
-            'id': bid,
-            'datetime': dt,
-            'date_str': date_str,
-            'time_str': time_str,
+        if current_group:
+            current_group['end_time'] = slot_index_datetime(last_index + 1)
+        current_group = {
+            'start_time': slot_index_datetime(index),
+            'ids': [bid],
+            'room': room,
             'group_name': group_name,
-            'user_id': user_id
-        })
-    grouped = []
-    current_group = None
-    for booking in bookings:
-        if not current_group:
-            current_group = {
-                'start_time': booking['datetime'],
-                'end_time': booking['datetime'] + timedelta(hours=1),
-                'ids': [booking['id']],
-                'group_name': booking['group_name'],
-                'user_id': booking['user_id'],
-                'date_str': booking['date_str']
-            }
-        else:
-            if (booking['group_name'] == current_group['group_name'] and
-                booking['user_id'] == current_group['user_id'] and
-                booking['datetime'] == current_group['end_time']):
-                current_group['end_time'] += timedelta(hours=1)
-                current_group['ids'].append(booking['id'])
-            else:
-                grouped.append(current_group)
-                current_group = {
-                    'start_time': booking['datetime'],
-                    'end_time': booking['datetime'] + timedelta(hours=1),
-                    'ids': [booking['id']],
-                    'group_name': booking['group_name'],
-                    'user_id': booking['user_id'],
-                    'date_str': booking['date_str']
-                }
-    if current_group:
+            'user_id': user_id,
+            'date_str': date_str
+        }
+        current_group.update(zip(extra_fields, extra))
         grouped.append(current_group)
+        last_index = index
+    if current_group:
+        current_group['end_time'] = slot_index_datetime(last_index + 1)
     return grouped
 
+def get_grouped_daily_bookings(date):
+    rows = get_repository().load_booking_rows(dates=(shift_date(date, -1), date, shift_date(date, 1)), extra_fields=('booking_type', 'comment'))
+    grouped = group_booking_rows(rows, ('booking_type', 'comment'))
+    return [g for g in grouped if g['date_str'] == date]
+
+def get_grouped_unconfirmed_bookings():
+    return group_booking_rows(get_repository().load_booking_rows(statuses=(1,)))
+
 def get_grouped_bookings_for_cancellation(date, created_by=None):
-    conn = sqlite3.connect('db/bookings.db')
-    cursor = conn.cursor()
-    prev_day = (datetime.strptime(date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-    next_day = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-    query = "SELECT id, date, time, group_name, created_by FROM slots WHERE date IN (?, ?, ?) AND status IN (1, 2)"
-    params = [prev_day, date, next_day]
-    if created_by is not None:
-        query += " AND created_by = ?"
-        params.append(created_by)
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
-    bookings = []
-    for row in rows:
-        bid, date_str, time_str, group_name, user_id = row
-        try:
-            dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-        except ValueError:
+    return get_cancellable_booking_groups(date, date, created_by).get(date, [])
+
+def get_cancellable_booking_groups(start_date, end_date=None, created_by=None):
+    rows = get_repository().load_booking_rows(
+        since=shift_date(start_date, -1),
+        until=shift_date(end_date, 1) if end_date is not None else None,
+        created_by=created_by
+    )
+    groups_by_date = {}
+    for group in sorted(group_booking_rows(rows), key=lambda g: (g['start_time'], g['room'])):
+        date_str = group['date_str']
+        if date_str < start_date or (end_date is not None and date_str > end_date):
             continue
-        bookings.append({
-            'id': bid,
-            'datetime': dt,
-            'date_str': date_str,
-            'time_str': time_str,
-            'group_name': group_name,
-            'user_id': user_id
-        })
-    grouped = []
-    current_group = None
-    for booking in bookings:
-        if not current_group:
-            current_group = {
-                'start_time': booking['datetime'],
-                'end_time': booking['datetime'] + timedelta(hours=1),
-                'ids': [booking['id']],
-                'group_name': booking['group_name'],
-                'user_id': booking['user_id'],
-                'date_str': booking['date_str']
-            }
-        else:
-            if (
-                booking['group_name'] == current_group['group_name'] and
-                booking['user_id'] == current_group['user_id'] and
-                booking['datetime'] == current_group['end_time']
-            ):
-                current_group['end_time'] += timedelta(hours=1)
-                current_group['ids'].append(booking['id'])
-            else:
-                grouped.append(current_group)
-                current_group = {
-                    'start_time': booking['datetime'],
-                    'end_time': booking['datetime'] + timedelta(hours=1),
-                    'ids': [booking['id']],
-                    'group_name': booking['group_name'],
-                    'user_id': booking['user_id'],
-                    'date_str': booking['date_str']
-                }
-    if current_group:
-        grouped.append(current_group)
-    filtered_grouped = [
-        g for g in grouped
-        if g['start_time'].strftime("%Y-%m-%d") == date
-    ]
-    return filtered_grouped
\ No newline at end of file
+        groups_by_date.setdefault(date_str, []).append(group)
+    return groups_by_date
@@ -0,0 +1,70 @@
+import re
+from lib.db import connect
+from lib.schedule_tasks import group_booking_rows
+
+SEARCH_RESULT_LIMIT = 20
+SEARCH_ROW_LIMIT = 2000
+
+def init_search(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'slots_fts'")
+    exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS slots_fts USING fts5(
+            group_name, contact_info, comment,
+            content='slots', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    new_has_text = "NEW.group_name IS NOT NULL OR NEW.contact_info IS NOT NULL OR NEW.comment IS NOT NULL"
+    old_has_text = "OLD.group_name IS NOT NULL OR OLD.contact_info IS NOT NULL OR OLD.comment IS NOT NULL"
+    insert_new = f"INSERT INTO slots_fts (rowid, group_name, contact_info, comment) SELECT NEW.id, NEW.group_name, NEW.contact_info, NEW.comment WHERE {new_has_text};"
+    delete_old = f"INSERT INTO slots_fts (slots_fts, rowid, group_name, contact_info, comment) SELECT 'delete', OLD.id, OLD.group_name, OLD.contact_info, OLD.comment WHERE {old_has_text};"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS slots_fts_insert AFTER INSERT ON slots
+        BEGIN
+            {insert_new}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS slots_fts_update AFTER UPDATE OF group_name, contact_info, comment ON slots
+        BEGIN
+            {delete_old}
+            {insert_new}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS slots_fts_delete AFTER DELETE ON slots
+        BEGIN
+            {delete_old}
+        END
+    ''')
+    if not exists:
+        cursor.execute(f'''
+            INSERT INTO slots_fts (rowid, group_name, contact_info, comment)
+            SELECT id, group_name, contact_info, comment FROM slots
+            WHERE group_name IS NOT NULL OR contact_info IS NOT NULL OR comment IS NOT NULL
+        ''')
+
+def build_match_query(text):
+    # Quoted prefix terms only, so user input cannot inject FTS5 syntax.
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+def search_booking_groups(text, limit=SEARCH_RESULT_LIMIT):
+    query = build_match_query(text)
+    if not query:
+        return []
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT s.id, s.room, s.date, s.time, s.group_name, s.created_by, s.contact_info, s.booking_type, s.comment
+        FROM slots_fts JOIN slots s ON s.id = slots_fts.rowid
+        WHERE slots_fts MATCH ? AND s.status > 0
+        ORDER BY s.room, s.date, s.time
+        LIMIT ?
+    ''', (query, SEARCH_ROW_LIMIT))
+    rows = cursor.fetchall()
+    conn.close()
+    groups = group_booking_rows(rows, extra_fields=("contact_info", "booking_type", "comment"))
+    groups.sort(key=lambda group: (group['start_time'], group['room']))
+    return groups[:limit]
@@ -0,0 +1,23 @@
+import os
+import threading
+
+_files = {}
+_lock = threading.Lock()
+
+def read_static_file(path, default=None):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return default
+    with _lock:
+        cached = _files.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            text = file.read().strip()
+    except FileNotFoundError:
+        return default
+    with _lock:
+        _files[path] = (mtime, text)
+    return text
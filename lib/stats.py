@@ -0,0 +1,67 @@
+from lib.db import connect
+from lib.timeslots import SLOT_MINUTES, day_number, shift_date
+
+STATS_WEEKS = 8
+STATS_TOP_GROUPS = 10
+
+STATS_TRANSITIONS = [
+    ("requested", "OLD.status = 0 AND NEW.status > 0", "NEW", "requested_minutes"),
+    ("confirmed", "OLD.status != 2 AND NEW.status = 2", "NEW", "confirmed_minutes"),
+    ("rejected", "OLD.status = 1 AND NEW.status = 0", "OLD", "rejected_minutes"),
+    ("cancelled", "OLD.status = 2 AND NEW.status = 0", "OLD", "cancelled_minutes"),
+]
+
+def init_stats(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'booking_stats'")
+    exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS booking_stats (
+            week TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            booking_type TEXT NOT NULL,
+            requested_minutes INTEGER NOT NULL DEFAULT 0,
+            confirmed_minutes INTEGER NOT NULL DEFAULT 0,
+            rejected_minutes INTEGER NOT NULL DEFAULT 0,
+            cancelled_minutes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (week, group_name, booking_type)
+        )
+    ''')
+    # The triggers embed SLOT_MINUTES, so they are recreated on every start.
+    for name, condition, row, column in STATS_TRANSITIONS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS booking_stats_{name}')
+        cursor.execute(f'''
+            CREATE TRIGGER booking_stats_{name} AFTER UPDATE OF status ON slots
+            WHEN {condition}
+            BEGIN
+                INSERT INTO booking_stats (week, group_name, booking_type, {column})
+                VALUES (date({row}.date, '-6 days', 'weekday 1'), COALESCE({row}.group_name, ''), COALESCE({row}.booking_type, ''), {SLOT_MINUTES})
+                ON CONFLICT (week, group_name, booking_type) DO UPDATE SET {column} = {column} + {SLOT_MINUTES};
+            END
+        ''')
+    if not exists:
+        cursor.execute(f'''
+            INSERT INTO booking_stats (week, group_name, booking_type, requested_minutes, confirmed_minutes)
+            SELECT date(date, '-6 days', 'weekday 1'), COALESCE(group_name, ''), COALESCE(booking_type, ''),
+                   COUNT(*) * {SLOT_MINUTES}, SUM(status = 2) * {SLOT_MINUTES}
+            FROM slots WHERE status > 0
+            GROUP BY 1, 2, 3
+        ''')
+
+def load_usage_stats(today, weeks=STATS_WEEKS, top_groups=STATS_TOP_GROUPS):
+    since = shift_date(today, -((day_number(today) - 1) % 7) - 7 * (weeks - 1))
+    conn = connect()
+    cursor = conn.cursor()
+    columns = 'SUM(requested_minutes), SUM(confirmed_minutes), SUM(rejected_minutes), SUM(cancelled_minutes)'
+    cursor.execute(f'SELECT {columns} FROM booking_stats WHERE week >= ?', (since,))
+    totals = tuple(value or 0 for value in cursor.fetchone())
+    cursor.execute(f'SELECT week, {columns} FROM booking_stats WHERE week >= ? GROUP BY week ORDER BY week', (since,))
+    by_week = cursor.fetchall()
+    cursor.execute(f'SELECT booking_type, {columns} FROM booking_stats WHERE week >= ? GROUP BY booking_type ORDER BY SUM(confirmed_minutes) DESC', (since,))
+    by_type = cursor.fetchall()
+    cursor.execute(
+        f'SELECT group_name, {columns} FROM booking_stats WHERE week >= ? GROUP BY group_name ORDER BY SUM(confirmed_minutes) DESC LIMIT ?',
+        (since, top_groups)
+    )
+    by_group = cursor.fetchall()
+    conn.close()
+    return {'since': since, 'totals': totals, 'by_week': by_week, 'by_type': by_type, 'by_group': by_group}
@@ -0,0 +1,55 @@
+import logging
+from telebot.apihelper import ApiTelegramException
+from lib.db import connect
+from lib.changes import get_last_change_seq
+
+logger = logging.getLogger(__name__)
+
+def get_variant_name(variant):
+    return ":".join(map(str, variant))
+
+def get_cached_file_id(bot_name, variant, version):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT file_id FROM telegram_files WHERE bot = ? AND variant = ? AND version = ?',
+        (bot_name, get_variant_name(variant), version)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def store_file_id(bot_name, variant, version, file_id):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM telegram_files WHERE version < ?', (version,))
+    cursor.execute(
+        'INSERT OR REPLACE INTO telegram_files (bot, variant, version, file_id) VALUES (?, ?, ?, ?)',
+        (bot_name, get_variant_name(variant), version, file_id)
+    )
+    conn.commit()
+    conn.close()
+
+def forget_file_id(bot_name, variant):
+    conn = connect()
+    conn.execute('DELETE FROM telegram_files WHERE bot = ? AND variant = ?', (bot_name, get_variant_name(variant)))
+    conn.commit()
+    conn.close()
+
+def send_schedule_photo(bot, bot_name, chat_id, variant, render, caption=None):
+    version = get_last_change_seq()
+    file_id = get_cached_file_id(bot_name, variant, version)
+    if file_id:
+        try:
+            bot.send_photo(chat_id, file_id, caption=caption)
+            return True
+        except ApiTelegramException as e:
+            logger.warning("Cached photo %s was rejected, uploading again: %s", file_id, e)
+            forget_file_id(bot_name, variant)
+    image = render()
+    if not image:
+        return False
+    sent = bot.send_photo(chat_id, image, caption=caption)
+    if sent and sent.photo:
+        store_file_id(bot_name, variant, version, sent.photo[-1].file_id)
+    return True
@@ -0,0 +1,118 @@
+import os
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SLOT_MINUTES = int(os.getenv("SLOT_MINUTES", "60"))
+if SLOT_MINUTES not in (15, 30, 60):
+    raise ValueError(f"SLOT_MINUTES must be 15, 30 or 60, got {SLOT_MINUTES}")
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+SLOTS_PER_DAY = 24 * SLOTS_PER_HOUR
+SLOT_DELTA = timedelta(minutes=SLOT_MINUTES)
+DAY_TIMES = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(0, 24 * 60, SLOT_MINUTES)]
+TIME_INDEX = {time: index for index, time in enumerate(DAY_TIMES)}
+_TIME_OFFSETS = [index * SLOT_DELTA for index in range(SLOTS_PER_DAY)]
+
+WEEKDAY_LABELS = ["ПН", "ВТ", "СР", "ЧТ", "ПТ", "СБ", "ВС"]
+MONTH_NAMES = ["Январь", "Февраль", "Март", "Апрель", "Май", "Июнь", "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"]
+TABLE_DAYS_BEFORE = 60
+TABLE_DAYS_AFTER = 400
+
+_DAY_NUMBERS = {}
+_DAY_STRINGS = {}
+_DAY_LABELS = {}
+_FULL_DATES = {}
+_DAY_STARTS = {}
+
+def _add_day(day):
+    value = date.fromordinal(day)
+    date_str = value.isoformat()
+    _DAY_NUMBERS[date_str] = day
+    _DAY_STRINGS[day] = date_str
+    _DAY_LABELS[day] = f"{value.day:02d}.{value.month:02d} {WEEKDAY_LABELS[value.weekday()]}"
+    _FULL_DATES[day] = f"{value.day:02d}.{value.month:02d}.{value.year}"
+    _DAY_STARTS[day] = datetime(value.year, value.month, value.day)
+    return day
+
+_today = date.today().toordinal()
+for _day in range(_today - TABLE_DAYS_BEFORE, _today + TABLE_DAYS_AFTER):
+    _add_day(_day)
+
+def day_number(date_str):
+    day = _DAY_NUMBERS.get(date_str)
+    if day is None:
+        day = _add_day(datetime.strptime(date_str, "%Y-%m-%d").toordinal())
+    return day
+
+def day_string(day):
+    date_str = _DAY_STRINGS.get(day)
+    if date_str is None:
+        date_str = _DAY_STRINGS[_add_day(day)]
+    return date_str
+
+def shift_date(date_str, days):
+    return day_string(day_number(date_str) + days)
+
+def format_day(date_str):
+    return _DAY_LABELS[day_number(date_str)]
+
+def format_full_date(date_str):
+    return _FULL_DATES[day_number(date_str)]
+
+def parse_day_label(text, year=None):
+    day, month = text.split()[0].split(".")
+    date_str = f"{year or date.today().year:04d}-{int(month):02d}-{int(day):02d}"
+    day_number(date_str)
+    return date_str
+
+def day_start(date_str):
+    return _DAY_STARTS[day_number(date_str)]
+
+def slot_index(date_str, time_str):
+    slot = TIME_INDEX.get(time_str)
+    if slot is None:
+        return None
+    return day_number(date_str) * SLOTS_PER_DAY + slot
+
+def slot_date(index):
+    return day_string(index // SLOTS_PER_DAY)
+
+def slot_time(index):
+    return DAY_TIMES[index % SLOTS_PER_DAY]
+
+def slot_index_datetime(index):
+    day, slot = divmod(index, SLOTS_PER_DAY)
+    if day not in _DAY_STARTS:
+        _add_day(day)
+    return _DAY_STARTS[day] + _TIME_OFFSETS[slot]
+
+def slot_datetime(date_str, time_str):
+    index = slot_index(date_str, time_str)
+    if index is None:
+        return datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
+    return slot_index_datetime(index)
+
+def slot_ranges(date_str, start_time, count):
+    start = slot_index(date_str, start_time)
+    last = start + count - 1
+    ranges = []
+    for day in range(start // SLOTS_PER_DAY, last // SLOTS_PER_DAY + 1):
+        first = max(start, day * SLOTS_PER_DAY)
+        end = min(last, (day + 1) * SLOTS_PER_DAY - 1)
+        ranges.append((day_string(day), slot_time(first), slot_time(end)))
+    return ranges
+
+def parse_duration(text):
+    try:
+        hours = float(text.strip().replace(",", "."))
+    except ValueError:
+        return None
+    count = hours * SLOTS_PER_HOUR
+    if count <= 0 or not count.is_integer():
+        return None
+    return int(count)
+
+def slots_to_hours(count):
+    hours = count / SLOTS_PER_HOUR
+    return int(hours) if hours.is_integer() else hours
@@ -1,12 +1,15 @@
 import os
 import re
-import sqlite3
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from lib.rooms import DEFAULT_ROOM, get_room_name, has_multiple_rooms
+from lib.timeslots import slot_ranges, slots_to_hours, format_day, format_full_date, parse_day_label
+from lib.outbox import wake_dispatcher
+from lib.repository import get_repository
 
 load_dotenv()
 
 ADMIN_IDS = list(map(int, os.getenv("ADMIN_IDS", "").split(",")))
+MAX_MESSAGE_LENGTH = 4096
 
 def is_admin(user_id):
     return user_id in ADMIN_IDS
@@ -21,15 +24,10 @@ def reset_user_state(chat_id, user_states):
         user_states.pop(key, None)
 
 def format_date(date_str):
-    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-    weekdays = ["ПН", "ВТ", "СР", "ЧТ", "ПТ", "СБ", "ВС"]
-    return f"{date_obj.strftime('%d.%m')} {weekdays[date_obj.weekday()]}"
+    return format_day(date_str)
 
 def format_date_to_db(date_str):
-    day_month, _ = date_str.split()
-    year = datetime.now().year
-    date_obj = datetime.strptime(f"{day_month}.{year}", "%d.%m.%Y")
-    return date_obj.strftime("%Y-%m-%d")
+    return parse_day_label(date_str)
 
 def validate_input(value, max_length=100):
     if not value:
@@ -40,7 +38,23 @@ def validate_input(value, max_length=100):
         return False
     return True
 
+def split_message_pages(entries, separator="\n\n", limit=MAX_MESSAGE_LENGTH):
+    pages = []
+    current = ""
+    for entry in entries:
+        entry = entry[:limit]
+        if current and len(current) + len(separator) + len(entry) > limit:
+            pages.append(current)
+            current = entry
+        else:
+            current = f"{current}{separator}{entry}" if current else entry
+    if current:
+        pages.append(current)
+    return pages
+
 def get_hour_word(hours):
+    if isinstance(hours, float):
+        return "часа"
     if 11 <= hours % 100 <= 14:
         return "часов"
     elif hours % 10 == 1:
@@ -50,58 +64,53 @@ def get_hour_word(hours):
     else:
         return "часов"
 
-def get_user_id_from_booking_ids(booking_ids):
-    with sqlite3.connect('db/bookings.db') as conn:
-        cursor = conn.cursor()
-        query = 'SELECT created_by FROM slots WHERE id IN ({})'.format(','.join('?' * len(booking_ids)))
-        cursor.execute(query, booking_ids)
-        result = cursor.fetchone()
-        return result[0] if result else None
-
-def confirm_booking(booking_ids):
-    with sqlite3.connect('db/bookings.db') as conn:
-        cursor = conn.cursor()
-        placeholders = ','.join('?' * len(booking_ids))
-        query = f'UPDATE slots SET status = 2 WHERE id IN ({placeholders})'
-        cursor.execute(query, booking_ids)
-        conn.commit()
-
-def reject_booking(booking_ids):
-    with sqlite3.connect('db/bookings.db') as conn:
-        cursor = conn.cursor()
-        placeholders = ','.join('?' * len(booking_ids))
-        query = f'UPDATE slots SET user_id = NULL, group_name = NULL, created_by = NULL, booking_type = NULL, comment = NULL, contact_info = NULL, subscribed_users = NULL, status = 0 WHERE id IN ({placeholders})'
-        cursor.execute(query, booking_ids)
-        conn.commit()
+def format_hours(count):
+    hours = slots_to_hours(count)
+    return f"{str(hours).replace('.', ',')} {get_hour_word(hours)}"
+
+def confirm_booking(booking_ids, notifications=(), created_by=None):
+    applied = get_repository().confirm(booking_ids, notifications, created_by)
+    if applied:
+        wake_dispatcher()
+    return applied
+
+def reject_booking(booking_ids, notifications=(), created_by=None, statuses=(1, 2), notify_subscribers=None):
+    applied = get_repository().clear(booking_ids, notifications, created_by, statuses, notify_subscribers)
+    if applied:
+        wake_dispatcher()
+    return applied
+
+def apply_booking_groups(bookings, confirm=True, notify=None):
+    applied = get_repository().apply_pending(bookings, confirm, notify)
+    wake_dispatcher()
+    return applied
 
 def format_booking_info(group):
     start_time = group['start_time'].strftime("%H:%M")
     end_time = group['end_time'].strftime("%H:%M")
-    date_str = datetime.strptime(group['date_str'], "%Y-%m-%d").strftime("%d.%m.%Y")
+    date_str = format_full_date(group['date_str'])
+    room_line = f"Зал: {get_room_name(group['room'])}\n" if has_multiple_rooms() else ""
     return f"Дата: {date_str}\n"\
            f"Время: {start_time}–{end_time}\n"\
+           f"{room_line}"\
            f"Группа: {group['group_name']}\n"\
            f"Контакт: @{group['user_id']}"
 
-def update_booking_status(date, time, status):
-    conn = sqlite3.connect('db/bookings.db', check_same_thread=False)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE slots SET status = ? WHERE date = ? AND time = ?', (status, date, time))
-    conn.commit()
-    conn.close()
-
-def book_slots(date, start_time, hours, user_id, group_name, booking_type, comment, contact_info):
-    conn = sqlite3.connect('db/bookings.db', check_same_thread=False)
-    cursor = conn.cursor()
-    start_hour = int(start_time.split(":")[0])
-    date_obj = datetime.strptime(date, "%Y-%m-%d")
-    for i in range(hours):
-        current_hour = start_hour + i
-        days_passed = current_hour // 24
-        hour_in_day = current_hour % 24
-        current_date = date_obj + timedelta(days=days_passed)
-        time = f"{hour_in_day:02d}:00"
-        current_date_str = current_date.strftime("%Y-%m-%d")
-        cursor.execute('UPDATE slots SET user_id = ?, group_name = ?, created_by = ?, booking_type = ?, comment = ?, contact_info = ?, status = 1 WHERE date = ? AND time = ?', (user_id, group_name, user_id, booking_type, comment, contact_info, current_date_str, time))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+def update_booking_status(date, time, status, room=DEFAULT_ROOM):
+    get_repository().set_status(room, date, time, status)
+
+def is_range_free(date, start_time, slot_count, room=DEFAULT_ROOM):
+    return get_repository().is_range_free(room, slot_ranges(date, start_time, slot_count))
+
+def book_slots(date, start_time, slot_count, user_id, group_name, booking_type, comment, contact_info, room=DEFAULT_ROOM, notify=None):
+    fields = {
+        "user_id": user_id,
+        "group_name": group_name,
+        "created_by": user_id,
+        "booking_type": booking_type,
+        "comment": comment,
+        "contact_info": contact_info
+    }
+    booking_ids = get_repository().book_ranges(room, slot_ranges(date, start_time, slot_count), fields, notify)
+    wake_dispatcher()
+    return booking_ids
\ No newline at end of file
@@ -1,76 +1,71 @@
 import os
-import sqlite3
-import telebot
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from lib.repository import get_repository
+from lib.outbound import send_message
+from lib.rooms import DEFAULT_ROOM
+from lib.timeslots import SLOT_MINUTES, shift_date, slot_index, slot_date, slot_time
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("MAIN_BOT_TOKEN")
-bot = telebot.TeleBot(BOT_TOKEN)
+bot = None
 
-def send_reminders():
+def get_bot():
+    global bot
+    if bot is None:
+        import telebot
+        bot = telebot.TeleBot(BOT_TOKEN)
+    return bot
+
+def send_reminders(reminder_bot=None):
     try:
-        conn = sqlite3.connect('db/bookings.db')
-        cursor = conn.cursor()
+        repository = get_repository()
         now = datetime.now()
         notification_times = [
             now + timedelta(hours=2),
             now + timedelta(hours=24)
         ]
         for notification_time in notification_times:
-            target_datetime = notification_time.strftime("%Y-%m-%d %H:%M")
             target_date = notification_time.strftime("%Y-%m-%d")
             target_time = notification_time.strftime("%H:%M")
-            cursor.execute("SELECT date, time, created_by, group_name FROM slots WHERE status = 2 AND date = ? AND time = ?", (target_date, target_time))
-            reminders_to_send = cursor.fetchall()
-            for reminder in reminders_to_send:
-                date, time, created_by, group_name = reminder
-                prev_time = (datetime.strptime(time, "%H:%M") - timedelta(hours=1)).strftime("%H:%M")
-                if prev_time == "23:00":
-                    prev_date = (datetime.strptime(date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
-                else:
-                    prev_date = date
-                cursor.execute("SELECT group_name, created_by FROM slots WHERE date = ? AND time = ?", (prev_date, prev_time))
-                prev_slot = cursor.fetchone()
-                if prev_slot:
-                    prev_group, prev_created = prev_slot
-                    if (prev_group == group_name and prev_created == created_by):
-                        continue
+            reminders_to_send = [
+                row for row in repository.load_booking_rows(dates=(target_date,), statuses=(2,))
+                if row[3] == target_time
+            ]
+            if not reminders_to_send:
+                continue
+            # Neighbouring rows on both sides of midnight tell where each booking starts and ends.
+            booked = {
+                (room, date, time): (group_name, created_by)
+                for _, room, date, time, group_name, created_by in repository.load_booking_rows(
+                    since=shift_date(target_date, -1), until=shift_date(target_date, 1)
+                )
+            }
+            for _, room, date, time, group_name, created_by in reminders_to_send:
+                prev_index = slot_index(date, time) - 1
+                if booked.get((room, slot_date(prev_index), slot_time(prev_index))) == (group_name, created_by):
+                    continue
                 message = (
                     f"🔔 *Напоминаем о забронированном времени:*\n"
                     f"_Дата:_ *{date}*\n"
-                    f"_Время:_ *{time} - {get_end_time(date, time, group_name, created_by, cursor)}*\n"
+                    f"_Время:_ *{time} - {get_end_time(date, time, group_name, created_by, booked, room)}*\n"
                     f"_Группа:_ *{group_name}*"
                 )
                 try:
-                    bot.send_message(created_by, message, parse_mode='Markdown')
+                    send_message(reminder_bot or get_bot(), created_by, message, parse_mode='Markdown')
                 except Exception as e:
                     print(f"[ERROR] Failed to send reminder to user {created_by}: {e}")
     except Exception as e:
         print(f"[ERROR] Error while processing reminders: {e}")
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
-def get_end_time(date, start_time, group_name, created_by, cursor):
-    start_datetime = datetime.strptime(f"{date} {start_time}", "%Y-%m-%d %H:%M")
-    current = start_datetime
-    while True:
-        next_hour = (current + timedelta(hours=1)).strftime("%H:%M")
-        next_date = current.strftime("%Y-%m-%d")
-        if next_hour == "00:00":
-            next_date = (current + timedelta(days=1)).strftime("%Y-%m-%d")
-        cursor.execute("SELECT group_name, created_by FROM slots WHERE date = ? AND time = ?", (next_date, next_hour))
-        next_slot = cursor.fetchone()
-        if not next_slot:
-            break
-        next_group, next_created = next_slot
-        if (next_group != group_name or next_created != created_by):
-            break
-        current += timedelta(hours=1)
-    end_time = (current + timedelta(hours=1)).strftime("%H:%M")
-    return end_time
+def get_end_time(date, start_time, group_name, created_by, booked, room=DEFAULT_ROOM):
+    end_index = slot_index(date, start_time) + 1
+    while booked.get((room, slot_date(end_index), slot_time(end_index))) == (group_name, created_by):
+        end_index += 1
+    return slot_time(end_index)
 
 if __name__ == "__main__":
-    send_reminders()
\ No newline at end of file
+    # cron runs every 15 minutes; with longer slots only runs on a slot boundary have anything to send.
+    if datetime.now().minute % SLOT_MINUTES == 0:
+        send_reminders()
\ No newline at end of file
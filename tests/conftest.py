@@ -0,0 +1,8 @@
+import os
+import sys
+
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("MAIN_BOT_TOKEN", "1:test")
+os.environ.setdefault("ADMIN_BOT_TOKEN", "2:test")
+os.environ["SLOT_MINUTES"] = "60"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
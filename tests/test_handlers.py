@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+import pytest
+import lib.db as db
+import lib.repository as repository_module
+from lib.repository import MemorySlotRepository
+from lib.rooms import DEFAULT_ROOM
+from lib.schedule_tasks import get_booking_dates
+
+USER_ID = 10
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    # Any direct SQLite access fails: the database directory does not exist.
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "missing" / "bookings.db"))
+    monkeypatch.setattr(db, "_version_conn", None)
+    repository = MemorySlotRepository()
+    repository.add_days(get_booking_dates())
+    monkeypatch.setattr(repository_module, "_repository", repository)
+    return repository
+
+@pytest.fixture
+def bots(monkeypatch):
+    import admin
+    import bot
+    calls = []
+    monkeypatch.setattr(bot.main_bot, "send_message", lambda chat_id, text, **kwargs: calls.append(("send", chat_id, text)))
+    monkeypatch.setattr(admin.admin_bot, "answer_callback_query", lambda call_id, text: calls.append(("answer", call_id, text)))
+    monkeypatch.setattr(admin.admin_bot, "edit_message_reply_markup", lambda **kwargs: calls.append(("edit", kwargs["message_id"])))
+    return bot, admin, calls
+
+def submit_booking(bot, day):
+    chat = SimpleNamespace(id=USER_ID)
+    bot.user_states.update({
+        f"{USER_ID}_selected_day": day,
+        f"{USER_ID}_selected_time": "12:00",
+        f"{USER_ID}_slot_count": 2,
+        f"{USER_ID}_group_name": "group",
+        f"{USER_ID}_booking_type": "Репетиция",
+        f"{USER_ID}_contact_info": "@user",
+    })
+    bot.handle_comment_input(SimpleNamespace(chat=chat, text="Ок", from_user=SimpleNamespace(id=USER_ID, username="user", first_name="User")))
+
+def tap(admin, data, call_id):
+    admin.handle_callback_query(SimpleNamespace(id=call_id, data=data, message=SimpleNamespace(chat=SimpleNamespace(id=1), message_id=call_id)))
+
+def test_booking_and_confirmation_on_memory_backend(repository, bots):
+    from lib.schedule_generator import get_schedule_grid_variant
+    bot, admin, calls = bots
+    day = get_booking_dates()[1]
+
+    submit_booking(bot, day)
+    assert [row[2:] for row in repository.load_booking_rows(statuses=(1,))] == [(day, "12:00", "group", USER_ID), (day, "13:00", "group", USER_ID)]
+    assert get_schedule_grid_variant(USER_ID, room=DEFAULT_ROOM)[0] == "grid_user"
+
+    bot_name, _, _, options = repository.outbox[0]
+    confirm_data = options["reply_markup"].keyboard[0][0].callback_data
+    assert bot_name == "admin" and confirm_data.startswith("confirm:")
+    tap(admin, confirm_data, 1)
+    tap(admin, confirm_data, 2)
+
+    assert [call for call in calls if call[0] == "answer"] == [("answer", 1, "✅ Бронь подтверждена."), ("answer", 2, "Эта бронь уже обработана.")]
+    assert len(repository.load_booking_rows(statuses=(2,))) == 2
+    assert [(bot_name, chat_id) for bot_name, chat_id, _, _ in repository.outbox[1:]] == [("main", USER_ID)]
@@ -0,0 +1,156 @@
+import pytest
+import lib.db as db
+from lib.db_init import init_db
+from lib.notifiers import subscriber_notifications
+from lib.repository import MemorySlotRepository, SqliteSlotRepository
+from lib.rooms import DEFAULT_ROOM
+from lib.schedule_tasks import get_booking_dates
+from lib.timeslots import slot_ranges
+
+ROOM = DEFAULT_ROOM
+
+def booking_fields(user_id):
+    return {
+        "user_id": user_id,
+        "group_name": f"group {user_id}",
+        "created_by": user_id,
+        "booking_type": "Репетиция",
+        "comment": "",
+        "contact_info": f"@user{user_id}",
+    }
+
+def admin_notifications(booking_ids, cursor):
+    return [("admin", 1, f"new booking of {len(booking_ids)} slots", {})]
+
+def read_outbox():
+    conn = db.connect()
+    try:
+        return conn.execute("SELECT bot, chat_id, text FROM outbox ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+@pytest.fixture
+def sqlite_repository(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bookings.db"))
+    monkeypatch.setattr(db, "_version_conn", None)
+    init_db()
+    repository = SqliteSlotRepository()
+    repository.sent = read_outbox
+    return repository
+
+@pytest.fixture
+def memory_repository():
+    repository = MemorySlotRepository()
+    repository.add_days(get_booking_dates())
+    repository.sent = lambda: [(bot, chat_id, text) for bot, chat_id, text, _ in repository.outbox]
+    return repository
+
+def slot_keys(repository, ids):
+    rows = {row[0]: row for row in repository.load_booking_rows(statuses=(0, 1, 2))}
+    return [rows[slot_id][1:4] for slot_id in ids]
+
+def subscriptions(repository, date):
+    return [(time, sorted(users.split(",")) if users else []) for time, users in repository.get_subscriptions(ROOM, date)]
+
+def snapshot(repository, dates):
+    return {
+        "bookings": [row[1:] for row in repository.load_booking_rows(extra_fields=("contact_info", "booking_type"))],
+        "days": [repository.load_room_day(ROOM, date) for date in dates],
+        "free": repository.count_free_slots(dates[0], dates[-1], "11:00", "00:00"),
+        "booked_dates": sorted(repository.get_booked_dates(ROOM, dates[0], "11:00")),
+        "subscriptions": [subscriptions(repository, date) for date in dates],
+        "dates": repository.get_dates(dates[1], 2),
+        "user_slots": repository.get_user_slots(ROOM, 10, dates[0], dates[-1]),
+    }
+
+def run_session(repository):
+    dates = get_booking_dates()
+    day, other_day = dates[1], dates[2]
+    transcript = {}
+    seq = repository.get_last_change_seq()
+
+    first = repository.book_ranges(ROOM, slot_ranges(day, "12:00", 2), booking_fields(10), admin_notifications)
+    transcript["first"] = slot_keys(repository, first)
+    transcript["changed"] = sorted(repository.get_changed_dates_since(seq)[1])
+    transcript["overlap"] = repository.book_ranges(ROOM, slot_ranges(day, "13:00", 2), booking_fields(11), admin_notifications)
+    transcript["free_checks"] = [
+        repository.is_range_free(ROOM, slot_ranges(day, "13:00", 1)),
+        repository.is_range_free(ROOM, slot_ranges(day, "14:00", 2)),
+    ]
+    second = repository.book_ranges(ROOM, slot_ranges(other_day, "23:00", 2), booking_fields(11), admin_notifications)
+    transcript["second"] = slot_keys(repository, second)
+    transcript["after_booking"] = snapshot(repository, dates[:4])
+
+    repository.confirm(first, [("main", 10, "confirmed", {})])
+    for user_id in (42, 43, 42):
+        repository.add_subscriber(ROOM, day, "12:00", user_id)
+    transcript["after_confirm"] = snapshot(repository, dates[:4])
+
+    rejected = repository.apply_pending([{"ids": second, "created_by": 11}, {"ids": first, "created_by": 10}], False)
+    transcript["rejected"] = [slot_keys(repository, booking["ids"]) for booking in rejected]
+    repository.clear(first, [("main", 10, "cancelled", {})], created_by=10, notify_subscribers=subscriber_notifications)
+    transcript["after_cancel"] = snapshot(repository, dates[:4])
+    transcript["outbox"] = repository.sent()
+    return transcript
+
+def test_sqlite_and_memory_backends_agree(sqlite_repository, memory_repository):
+    assert run_session(sqlite_repository) == run_session(memory_repository)
+
+@pytest.mark.parametrize("backend", ["sqlite_repository", "memory_repository"])
+def test_booking_session(backend, request):
+    repository = request.getfixturevalue(backend)
+    dates = get_booking_dates()
+    transcript = run_session(repository)
+
+    assert [key[2] for key in transcript["first"]] == ["12:00", "13:00"]
+    assert transcript["changed"] == [dates[1]]
+    assert transcript["overlap"] == []
+    assert transcript["free_checks"] == [False, True]
+    assert transcript["second"] == [(ROOM, dates[2], "23:00"), (ROOM, dates[3], "00:00")]
+    assert transcript["after_booking"]["booked_dates"] == list(dates[1:3])
+    assert transcript["after_booking"]["dates"] == list(dates[1:3])
+    assert transcript["after_confirm"]["user_slots"] == [(dates[1], "12:00"), (dates[1], "13:00")]
+    assert transcript["after_confirm"]["subscriptions"][1] == [("12:00", ["42", "43"]), ("13:00", [])]
+    assert transcript["rejected"] == [transcript["second"]]
+    assert transcript["after_cancel"]["bookings"] == []
+    assert transcript["after_cancel"]["subscriptions"][1] == []
+    assert transcript["outbox"] == [
+        ("admin", 1, "new booking of 2 slots"),
+        ("admin", 1, "new booking of 2 slots"),
+        ("main", 10, "confirmed"),
+        ("main", 10, "cancelled"),
+        ("main", 42, subscriber_notifications([(dates[1], "12:00", "42")])[0][2]),
+        ("main", 43, subscriber_notifications([(dates[1], "12:00", "43")])[0][2]),
+    ]
+
+@pytest.mark.parametrize("backend", ["sqlite_repository", "memory_repository"])
+def test_resolved_booking_is_not_changed_again(backend, request):
+    repository = request.getfixturevalue(backend)
+    day = get_booking_dates()[1]
+    ids = repository.book_ranges(ROOM, slot_ranges(day, "12:00", 2), booking_fields(10))
+
+    assert repository.confirm(ids, [("main", 10, "confirmed", {})], created_by=10)
+    assert not repository.confirm(ids, [("main", 10, "confirmed again", {})], created_by=10)
+    assert not repository.clear(ids, [("main", 10, "rejected", {})], created_by=10, statuses=(1,))
+    assert not repository.clear(ids, [("main", 11, "cancelled", {})], created_by=11)
+    assert [row[0] for row in repository.load_booking_rows(statuses=(2,))] == ids
+
+    rebooked = repository.clear(ids, created_by=10) and repository.book_ranges(ROOM, slot_ranges(day, "12:00", 2), booking_fields(11))
+    assert rebooked == ids
+    assert not repository.clear(ids, [("main", 10, "stale cancel", {})], created_by=10)
+    assert repository.sent() == [("main", 10, "confirmed")]
+
+@pytest.mark.parametrize("backend", ["sqlite_repository", "memory_repository"])
+def test_booking_tokens(backend, request):
+    repository = request.getfixturevalue(backend)
+    day = get_booking_dates()[1]
+    ids = repository.book_ranges(ROOM, slot_ranges(day, "12:00", 2), booking_fields(10))
+    booking = {"ids": ids, "created_by": 10, "date": day, "start_time": "12:00", "end_time": "14:00", "group_name": "group 10"}
+
+    repository.add_booking_token("token", booking)
+    assert repository.load_slots_by_id(ids) == [(day, "12:00", "group 10", 10), (day, "13:00", "group 10", 10)]
+    assert repository.get_booking_token("token") == {**booking, "token": "token"}
+    assert repository.get_booking_token("missing") is None
+    assert [repository.set_booking_token_used("token", True) for _ in range(2)] == [True, False]
+    assert repository.set_booking_token_used("token", False)
+    assert repository.set_booking_token_used("token", True)
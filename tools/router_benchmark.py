@@ -0,0 +1,73 @@
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("MAIN_BOT_TOKEN", "0:router-benchmark")
+os.environ.setdefault("ADMIN_BOT_TOKEN", "0:router-benchmark")
+os.environ.setdefault("ADMIN_IDS", "0")
+
+import bot
+
+MESSAGES = 100000
+CHATS = 1000
+
+def build_linear_predicates(router, user_states):
+    predicates = []
+    for kind, key, handler in router.routes():
+        if kind == "text":
+            predicate = lambda msg, text=key: msg.text == text
+        elif kind == "step":
+            predicate = lambda msg, step=key: bot.get_state_step(user_states, msg.chat.id) == step
+        else:
+            predicate = lambda msg, key=key: bot.get_state_step(user_states, msg.chat.id) == key[0] and msg.text == key[1]
+        predicates.append((predicate, handler))
+    return predicates
+
+def linear_resolve(predicates, message):
+    for predicate, handler in predicates:
+        if predicate(message):
+            return handler
+    return None
+
+def build_workload(router, user_states):
+    rng = random.Random(1)
+    routes = router.routes()
+    texts = [key for kind, key, _ in routes if kind == "text"]
+    steps = [key for kind, key, _ in routes if kind == "step"]
+    for chat_id in range(CHATS):
+        step = rng.choice(steps + [None] * len(steps))
+        if step and step.startswith("choose_"):
+            user_states[chat_id] = {"step": step}
+        elif step:
+            user_states[chat_id] = step
+    return [
+        SimpleNamespace(chat=SimpleNamespace(id=rng.randrange(CHATS)), text=rng.choice(texts + ["12.05 ПН", "2", "Группа"]))
+        for _ in range(MESSAGES)
+    ]
+
+def measure(resolve, messages):
+    started = time.perf_counter()
+    for message in messages:
+        resolve(message)
+    return (time.perf_counter() - started) / len(messages) * 1e6
+
+def main():
+    router = bot.router
+    user_states = bot.user_states
+    predicates = build_linear_predicates(router, user_states)
+    messages = build_workload(router, user_states)
+    mismatches = sum(router.resolve(message) is not linear_resolve(predicates, message) for message in messages)
+    linear_us = measure(lambda message: linear_resolve(predicates, message), messages)
+    router_us = measure(router.resolve, messages)
+    print(f"routes: {len(predicates)}, messages: {len(messages)}, mismatches: {mismatches}")
+    print(f"linear predicate scan {linear_us:6.2f} us/message")
+    print(f"dispatch table        {router_us:6.2f} us/message  ({linear_us / router_us:.1f}x)")
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUDGETS_MS = {
+    "bot": 300,
+    "admin": 300,
+    "reminder": 50,
+    "db_updater": 50,
+}
+
+DEFERRED_MODULES = {
+    "bot": ["PIL.ImageDraw", "PIL.ImageFont", "lib.schedule_generator"],
+    "admin": ["PIL.ImageDraw", "PIL.ImageFont", "lib.schedule_generator"],
+    "reminder": ["telebot", "PIL"],
+    "db_updater": ["telebot", "PIL"],
+}
+
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+def measure_imports(module):
+    env = dict(os.environ)
+    env.setdefault("MAIN_BOT_TOKEN", "0:startup-check")
+    env.setdefault("ADMIN_BOT_TOKEN", "0:startup-check")
+    env.setdefault("ADMIN_IDS", "0")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    total_us = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        imported.add(name)
+        # Only the target's own subtree; interpreter startup (site, encodings) is not charged to it.
+        if name == module and len(indent) == 1:
+            total_us = int(cumulative)
+    if total_us is None:
+        raise RuntimeError(f"import {module} did not appear in -X importtime output")
+    return total_us / 1000, imported
+
+def main():
+    modules = sys.argv[1:] or list(BUDGETS_MS)
+    failed = False
+    for module in modules:
+        total_ms, imported = measure_imports(module)
+        budget = BUDGETS_MS.get(module)
+        eager = [name for name in DEFERRED_MODULES.get(module, []) if name in imported]
+        status = "ok"
+        if budget is not None and total_ms > budget:
+            status = "over budget"
+            failed = True
+        if eager:
+            status = f"eager import of {', '.join(eager)}"
+            failed = True
+        print(f"{module:<12} {total_ms:8.1f} ms / {budget} ms  {status}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("ADMIN_IDS", "0")
+
+import lib.db
+from lib.repository import MemorySlotRepository, SqliteSlotRepository, set_repository
+from lib.timeslots import shift_date
+
+DAYS = 28
+BOOKINGS = 200
+
+def run_workload(today):
+    from lib.utils import book_slots, confirm_booking, is_range_free
+    from lib.schedule_tasks import get_day_slots, get_free_days, get_grouped_unconfirmed_bookings, get_cancellable_booking_groups
+    timings = {}
+    def timed(name, action):
+        started = time.perf_counter()
+        result = action()
+        timings[name] = timings.get(name, 0) + time.perf_counter() - started
+        return result
+    for i in range(BOOKINGS):
+        date = shift_date(today, i % DAYS)
+        start_time = f"{11 + i // DAYS % 12:02d}:00"
+        if timed("is_range_free", lambda: is_range_free(date, start_time, 1)):
+            ids = timed("book_slots", lambda: book_slots(date, start_time, 1, i, f"group {i}", "Репетиция", "", "@user"))
+            if i % 2:
+                timed("confirm_booking", lambda: confirm_booking(ids))
+        timed("get_day_slots", lambda: get_day_slots(date))
+        timed("get_free_days", get_free_days)
+    timed("get_grouped_unconfirmed_bookings", get_grouped_unconfirmed_bookings)
+    timed("get_cancellable_booking_groups", lambda: get_cancellable_booking_groups(today))
+    return timings
+
+def main():
+    today = datetime.now().strftime("%Y-%m-%d")
+    with tempfile.TemporaryDirectory() as directory:
+        lib.db.DB_PATH = os.path.join(directory, "bookings.db")
+        from lib.db_init import init_db
+        init_db()
+        set_repository(SqliteSlotRepository())
+        sqlite_timings = run_workload(today)
+    memory = MemorySlotRepository()
+    memory.add_days([shift_date(today, i) for i in range(DAYS)])
+    set_repository(memory)
+    memory_timings = run_workload(today)
+    print(f"{'operation':<34} {'sqlite ms':>10} {'memory ms':>10}")
+    for name, sqlite_seconds in sqlite_timings.items():
+        print(f"{name:<34} {sqlite_seconds * 1000:10.1f} {memory_timings[name] * 1000:10.1f}")
+    print(f"{'total':<34} {sum(sqlite_timings.values()) * 1000:10.1f} {sum(memory_timings.values()) * 1000:10.1f}")
+
+if __name__ == "__main__":
+    main()